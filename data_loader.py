@@ -1,8 +1,25 @@
 ### data_loader.py ###
 # data_loader.py
-import streamlit as st
 import pandas as pd
+import numpy as np
 import json
+import os
+import io
+import glob
+import hashlib
+import threading
+import logging
+
+# 엑셀 파싱 결과를 저장하는 컬럼형(Parquet) 캐시 설정
+DATA_CACHE_DIR = os.getenv('DATA_CACHE_DIR', '.data_cache')
+DATA_CACHE_MAX_FILES = int(os.getenv('DATA_CACHE_MAX_FILES', '50'))
+# 캐시 파일 형식이 바뀌면 올려서 기존 캐시를 무효화합니다.
+DATA_CACHE_FORMAT_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+# 반복되는 문자열 값이 많아 범주형으로 저장할 컬럼
+CATEGORY_COLUMNS = ['대학명', '전형구분', '전형명', '계열', '계열구분', '분류', '그룹', '2025년_최저요약']
 
 def classify_data(df):
     """
@@ -24,22 +41,278 @@ def remove_duplicates(df):
 
 
 
-@st.cache_data
+def _read_source_bytes(source):
+    # 파일 경로와 업로드된 파일(st.file_uploader) 모두 지원
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def _normalize_for_arrow(df):
+    """
+    문자열과 숫자가 섞인 object 컬럼은 Arrow로 저장할 수 없으므로 문자열로 통일합니다.
+    """
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].dropna()
+            if values.map(type).nunique() > 1:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _prune_data_cache():
+    cache_files = sorted(glob.glob(os.path.join(DATA_CACHE_DIR, '*.parquet')), key=os.path.getmtime)
+    for path in cache_files[:-DATA_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def read_excel_cached(source):
+    """
+    엑셀 파일을 읽습니다. 파일 내용의 해시를 키로 Parquet 캐시를 만들어 두고,
+    같은 내용의 파일은 다음부터 엑셀 파싱 없이 캐시에서 읽습니다.
+    """
+    content = _read_source_bytes(source)
+    content_hash = hashlib.sha256(content).hexdigest()
+    cache_path = os.path.join(DATA_CACHE_DIR, f"v{DATA_CACHE_FORMAT_VERSION}_{content_hash}.parquet")
+
+    if os.path.exists(cache_path):
+        try:
+            df = pd.read_parquet(cache_path)
+            # Parquet에서 읽은 문자열 컬럼의 결측값(None)을 엑셀과 같은 NaN으로 맞춤
+            for col in df.columns:
+                if df[col].dtype == object:
+                    df[col] = df[col].where(df[col].notna(), np.nan)
+            df.attrs['content_hash'] = content_hash
+            return df
+        except Exception:
+            pass  # 손상된 캐시는 아래에서 다시 생성
+
+    df = _normalize_for_arrow(pd.read_excel(io.BytesIO(content)))
+
+    try:
+        os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        _prune_data_cache()
+    except (ImportError, OSError, ValueError) as e:
+        # pyarrow가 없거나 디렉터리에 쓸 수 없으면 캐시 없이 진행
+        logger.warning("데이터 캐시 저장 실패: %s", e)
+
+    df.attrs['content_hash'] = content_hash
+    return df
+
+
+def _is_float32_exact(values):
+    # float32로 바꿔도 모든 값이 그대로 복원되는 경우에만 True
+    with np.errstate(over='ignore'):
+        restored = values.astype(np.float32).astype(np.float64)
+    return np.array_equal(restored, values, equal_nan=True)
+
+
+def apply_compact_schema(df):
+    """
+    문자열 컬럼은 범주형으로, 숫자 컬럼은 값이 바뀌지 않는 범위에서 더 작은 타입으로 변환합니다.
+    변환 전후 메모리 사용량(바이트)을 함께 반환합니다.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    for col in df.select_dtypes(include='float').columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        if _is_float32_exact(values):
+            df[col] = values.astype(np.float32)
+
+    after = int(df.memory_usage(deep=True).sum())
+    return df, {'before': before, 'after': after}
+
+
+# 대체데이터사용 == 1인 행에서 대신 사용할 계열 단위 컬럼
+SUBSTITUTE_COLUMNS = {
+    '2024년_경쟁률': '2024년_계열경쟁률',
+    '2024년_경쟁률백분위': '2024년_계열경쟁률백분위',
+    '2024년_경쟁률변동(%)': '2024년_계열경쟁률변동(%)',
+    '3개년_경쟁률_평균': '3개년_계열경쟁률_평균',
+    '2024년_입결70%': '2024년_계열입결70%',
+    '2024년_입결70%변동(%)': '2024년_계열입결70%변동(%)',
+    '3개년_입결70%_평균': '3개년_계열입결70%_평균',
+    '2024년_충원율(%)': '2024년_계열충원율(%)',
+    '3개년_충원율_평균': '3개년_계열충원율_평균'
+}
+# 유효 컬럼 값이 계열 컬럼에서 왔는지 기록하는 컬럼
+EFFECTIVE_SOURCE_COLUMN = '유효값_계열대체'
+
+
+def effective_column_name(column):
+    return f'유효_{column}'
+
+
+def add_effective_columns(df):
+    """
+    대체데이터사용 여부에 따라 원래 컬럼과 계열 컬럼 중 실제로 사용할 값을
+    '유효_' 컬럼으로 미리 계산해 둡니다.
+    """
+    use_substitute = (df['대체데이터사용'] == 1).to_numpy()
+    for column, substitute in SUBSTITUTE_COLUMNS.items():
+        if column in df.columns and substitute in df.columns:
+            df[effective_column_name(column)] = np.where(use_substitute, df[substitute], df[column])
+    df[EFFECTIVE_SOURCE_COLUMN] = use_substitute
+    return df
+
+
+def effective_value(row, column):
+    # 유효 컬럼이 없는 데이터(직접 업로드 등)는 원래 컬럼 값을 사용
+    effective = effective_column_name(column)
+    if effective in row.index and pd.notna(row[effective]):
+        return row[effective]
+    return row[column]
+
+
+# 같은 (전형구분, 계열구분) 안에서 연도별 백분위를 계산할 지표. 컬럼명은 '{연도}년_{지표}'
+PERCENTILE_GROUP_COLUMNS = ['전형구분', '계열구분']
+PERCENTILE_YEARS = [2022, 2023, 2024]
+PERCENTILE_METRICS = ['입결70%', '입결50%', '경쟁률', '충원율(%)']
+# 지표별 결측 표시 값 (입결은 0도 값이 없다는 뜻)
+PERCENTILE_MISSING_VALUES = {'입결70%': [0, -9999], '입결50%': [0, -9999], '경쟁률': [-9999], '충원율(%)': [-9999]}
+# 연도별 지표 외에 백분위를 계산할 3개년 평균 컬럼과 그 지표
+PERCENTILE_AVERAGE_COLUMNS = {'3개년_경쟁률_평균': '경쟁률'}
+
+
+def percentile_column_name(column):
+    return f'{column}_계열내백분위'
+
+
+def percentile_source_columns():
+    # 백분위 컬럼을 만드는 원본 컬럼과 지표
+    columns = {f'{year}년_{metric}': metric for year in PERCENTILE_YEARS for metric in PERCENTILE_METRICS}
+    columns.update(PERCENTILE_AVERAGE_COLUMNS)
+    return columns
+
+
+def add_group_percentile_columns(df):
+    """
+    (전형구분, 계열구분) 그룹 안에서 연도별 입결/경쟁률/충원율과 3개년 평균 경쟁률의 백분위(0~100, 값이 작을수록 낮음)를
+    계산해 float32 컬럼으로 추가합니다. 결측 표시 값은 백분위를 계산하지 않습니다.
+    '유효_' 컬럼(add_effective_columns)이 있으면 대체값을 반영한 그 값으로 계산하고, 없으면 원래 컬럼으로 계산합니다.
+    """
+    groups = [df[column] for column in PERCENTILE_GROUP_COLUMNS]
+    for column, metric in percentile_source_columns().items():
+        source = effective_column_name(column) if effective_column_name(column) in df.columns else column
+        if source not in df.columns:
+            continue
+        values = pd.to_numeric(df[source], errors='coerce')
+        values = values.where(~values.isin(PERCENTILE_MISSING_VALUES[metric]))
+        percentile = values.groupby(groups, observed=True, dropna=False).rank(pct=True) * 100
+        df[percentile_column_name(column)] = percentile.astype(np.float32)
+    return df
+
+
 def load_data(file_path):
-    df = pd.read_excel(file_path)
+    df = read_excel_cached(file_path)
     if '신설' in df.columns and '첨단융합' in df.columns:
         df = classify_data(df)
+    if '대체데이터사용' in df.columns:
+        df = add_effective_columns(df)
+    if all(column in df.columns for column in PERCENTILE_GROUP_COLUMNS):
+        df = add_group_percentile_columns(df)
+    if '대학명' in df.columns:
+        df = add_rank_column(df)
     return df
 
 def load_json(file_path):
     with open(file_path, 'r') as f:
         return json.load(f)
 
-data = load_data('data_240808_1735.xlsx')
-additional_data = load_data('uni_info_summary_240802.xlsx')
+# 공유 데이터프레임에서 파생된 프레임에 값을 쓰더라도 원본 버퍼가 바뀌지 않도록 Copy-on-Write 사용
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+# 프로세스 전체(모든 세션)에서 공유하는 읽기 전용 데이터셋 레지스트리
+# 각 세션은 데이터프레임을 복사하지 않고 여기서 꺼내 쓰거나 행 번호로만 선택 결과를 보관합니다.
+_datasets = {}
+_index_builders = {}
+_registry_lock = threading.RLock()
+
+
+def register_dataset(name, df):
+    """
+    데이터셋을 레지스트리에 등록합니다. 같은 이름으로 다시 등록하면 버전이 바뀌고
+    해당 데이터셋의 인덱스는 다음 조회 시 새로 만들어집니다.
+    각 행의 index(0부터 시작하는 정수)가 행 번호이며, 세션에는 프레임 대신 이 행 번호만 보관합니다.
+    """
+    df = df.reset_index(drop=True)
+    version = df.attrs.get('content_hash') or hashlib.sha256(
+        pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+    with _registry_lock:
+        _datasets[name] = {'df': df, 'version': version, 'indexes': {}}
+    return df
+
+
+def load_dataset(name, file_path):
+    df, memory = apply_compact_schema(load_data(file_path))
+    logger.info("%s 메모리 사용량: %.1fMB -> %.1fMB", file_path, memory['before'] / 1e6, memory['after'] / 1e6)
+    return register_dataset(name, df)
+
+
+def get_dataset(name='main'):
+    return _datasets[name]['df']
+
+
+def dataset_version(name='main'):
+    return _datasets[name]['version']
+
+
+# 선택 결과가 없을 때 사용하는 빈 행 번호 배열
+EMPTY_ROW_IDS = np.array([], dtype=np.int64)
+EMPTY_ROW_IDS.setflags(write=False)
+
+
+def take_rows(row_ids, name='main'):
+    """
+    행 번호 배열로 공유 데이터셋의 해당 행만 꺼냅니다.
+    """
+    return get_dataset(name).take(np.asarray(row_ids, dtype=np.int64))
+
+
+def row_ids(df):
+    # 공유 데이터셋에서 꺼낸 프레임의 행 번호
+    return df.index.to_numpy(dtype=np.int64)
+
+
+def register_index(index_name, builder):
+    """
+    데이터셋에서 파생되는 인덱스 생성 함수를 등록합니다. builder(df)는 처음 조회될 때 실행됩니다.
+    """
+    with _registry_lock:
+        _index_builders[index_name] = builder
+        for entry in _datasets.values():
+            entry['indexes'].pop(index_name, None)
+
+
+def get_index(index_name, name='main'):
+    entry = _datasets[name]
+    if index_name not in entry['indexes']:
+        with _registry_lock:
+            if index_name not in entry['indexes']:
+                entry['indexes'][index_name] = _index_builders[index_name](entry['df'])
+    return entry['indexes'][index_name]
+
+
 lowest_ability_data = load_json('lowest_ability_codes.json')
 lowest_ability_codes = lowest_ability_data['codes']
 lowest_ability_ui_options = lowest_ability_data['ui_options']
+# 화면별로 브라우저에 보낼 컬럼 목록
+view_schemas = load_json('view_schemas.json')
 
 
 
@@ -143,4 +416,36 @@ ranking = [
     "한성대학교",
     "삼육대학교",
     "서경대학교"
-]
\ No newline at end of file
+]
+
+# 대학별 순위 (ranking 리스트에서의 위치). 목록에 없는 대학은 가장 뒤로 보냅니다.
+RANKING_POSITION = {univ: i for i, univ in enumerate(ranking)}
+UNRANKED_POSITION = len(ranking)
+
+
+def add_rank_column(df):
+    df['rank'] = df['대학명'].astype(object).map(RANKING_POSITION).fillna(UNRANKED_POSITION).astype(np.int16)
+    return df
+
+
+def sort_by_rank(df):
+    """
+    대학 순위(rank) 기준 안정 정렬. 같은 대학 안에서는 기존 순서를 유지하고, 이미 순위 순서이면 그대로 반환합니다.
+    """
+    if 'rank' not in df.columns:
+        if '대학명' not in df.columns:
+            return df
+        df = add_rank_column(df.copy())
+    ranks = df['rank'].to_numpy()
+    if np.all(ranks[:-1] <= ranks[1:]):
+        return df
+    return df.take(np.argsort(ranks, kind='stable'))
+
+
+def universities_by_rank(df):
+    # df에 있는 대학명을 순위 순서로 (순위가 같으면 처음 나온 순서)
+    return sort_by_rank(df.drop_duplicates('대학명'))['대학명'].tolist()
+
+
+data = load_dataset('main', 'data_240808_1735.xlsx')
+additional_data = load_dataset('additional', 'uni_info_summary_240802.xlsx')
@@ -1,20 +1,36 @@
+import re
+import hashlib
+from collections import namedtuple
 import pandas as pd
-from data_loader import SCHOOL_TYPE_ADJUSTMENT, university_ranges, ranking
+import numpy as np
+from data_loader import SCHOOL_TYPE_ADJUSTMENT, SUBSTITUTE_COLUMNS, effective_column_name, \
+    get_dataset, get_index, add_effective_columns, EFFECTIVE_SOURCE_COLUMN, dataset_version
+from category_mapping import DETAIL_TO_MID_CATEGORY
+from result_cache import first_pass_cache, slice_counter_cache
+# get_index로 조회하는 인덱스(bitmaps, percentiles, detail_fields 등)를 등록하기 위해 import
+import indexes  # noqa: F401
+
+# 선언적 필터 조건. column 값에 연산자 op를 value와 함께 적용합니다.
+# op: '==', '!=', 'in', 'not in', '<', '<=', '>', '>=', 'between', 'contains', 'not contains', 'contains any'
+Predicate = namedtuple('Predicate', ['column', 'op', 'value'])
+
+_STRING_OPS = ('contains', 'not contains', 'contains any')
+# 조건별 통과 비율을 추정할 때 사용하는 표본 크기
+_SELECTIVITY_SAMPLE_SIZE = 256
+
+
+def _normalize(value):
+    # 캐시 키로 쓸 수 있도록 리스트/집합/딕셔너리를 정렬된 튜플로 변환
+    if isinstance(value, dict):
+        return tuple(sorted((key, _normalize(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_normalize(item) for item in value]
+        return tuple(sorted(items, key=repr)) if isinstance(value, (set, frozenset)) else tuple(items)
+    return value
 
 
 def get_substitute_column_name(column):
-    substitutions = {
-        '2024년_경쟁률': '2024년_계열경쟁률',
-        '2024년_경쟁률백분위': '2024년_계열경쟁률백분위',
-        '2024년_경쟁률변동(%)': '2024년_계열경쟁률변동(%)',
-        '3개년_경쟁률_평균': '3개년_계열경쟁률_평균',
-        '2024년_입결70%': '2024년_계열입결70%',
-        '2024년_입결70%변동(%)': '2024년_계열입결70%변동(%)',
-        '3개년_입결70%_평균': '3개년_계열입결70%_평균',
-        '2024년_충원율(%)': '2024년_계열충원율(%)',
-        '3개년_충원율_평균': '3개년_계열충원율_평균'
-    }
-    return substitutions.get(column, column)
+    return SUBSTITUTE_COLUMNS.get(column, column)
 
 def get_column_value(df, row, column):
     if row['대체데이터사용'] == 1:
@@ -23,24 +39,170 @@ def get_column_value(df, row, column):
     return row[column]
 
 
+def _evaluate(values, op, value):
+    if op == '==':
+        result = values == value
+    elif op == '!=':
+        result = values != value
+    elif op == 'in':
+        result = values.isin(value)
+    elif op == 'not in':
+        result = ~values.isin(value)
+    elif op == '<':
+        result = values < value
+    elif op == '<=':
+        result = values <= value
+    elif op == '>':
+        result = values > value
+    elif op == '>=':
+        result = values >= value
+    elif op == 'between':
+        result = (values >= value[0]) & (values <= value[1])
+    elif op == 'contains':
+        result = values.astype(str).str.contains(value, regex=False)
+    elif op == 'not contains':
+        result = ~values.astype(str).str.contains(value, regex=False)
+    elif op == 'contains any':
+        # 대소문자 구분 없이 value 중 하나라도 포함하면 True
+        if not value:
+            return np.zeros(len(values), dtype=bool)
+        pattern = '|'.join(re.escape(str(v).lower()) for v in value)
+        result = values.astype(str).str.lower().str.contains(pattern, regex=True)
+    else:
+        raise ValueError(f"지원하지 않는 필터 연산자입니다: {op}")
+    return np.asarray(result, dtype=bool)
+
+
+def evaluate_predicate(df, predicate, positions=None):
+    """
+    positions 위치의 행(없으면 전체 행)에 대해 조건을 평가한 boolean 배열을 반환합니다.
+    """
+    values = df[predicate.column]
+    if positions is not None:
+        values = values.take(positions)
+
+    # 범주형 컬럼의 문자열 조건은 범주 값에 대해서만 한 번 계산
+    if isinstance(values.dtype, pd.CategoricalDtype) and predicate.op in _STRING_OPS:
+        categories = pd.Series(values.cat.categories.astype(str))
+        category_result = _evaluate(categories, predicate.op, predicate.value)
+        missing_result = _evaluate(pd.Series(['nan']), predicate.op, predicate.value)[0]
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_result[codes], missing_result)
+
+    return _evaluate(values, predicate.op, predicate.value)
+
+
+def estimate_selectivity(df, predicate, positions):
+    # 표본 행에서 조건을 통과하는 비율. 작을수록 먼저 평가합니다.
+    if len(positions) == 0:
+        return 0.0
+    sample_size = min(len(positions), _SELECTIVITY_SAMPLE_SIZE)
+    sample = positions[np.linspace(0, len(positions) - 1, sample_size).astype(np.int64)]
+    return evaluate_predicate(df, predicate, sample).mean()
+
+
+def indexed_bitmap(df, predicate):
+    """
+    공유 데이터셋에 대해 미리 만들어 둔 인덱스로 조건을 만족하는 행의 비트맵을 찾습니다.
+    사용할 수 있는 인덱스가 없으면 None을 반환합니다.
+    """
+    if df is not get_dataset('main'):
+        return None
+    bitmaps = get_index('bitmaps')
+    if predicate.column == '계열상세명' and predicate.op == 'contains any':
+        return bitmaps.from_rows(get_index('detail_fields').rows(predicate.value))
+    if predicate.op == 'between' and predicate.column in get_index('percentiles'):
+        return bitmaps.from_rows(get_index('percentiles').rows_between(predicate.column, *predicate.value))
+    return bitmaps.lookup(predicate)
+
+
+def select_rows(df, predicates, candidates=None):
+    """
+    조건 목록을 모두 만족하는 행의 위치(positions)를 반환합니다.
+    인덱스가 있는 조건은 비트맵 AND로 먼저 적용하고, 나머지는 통과 비율이 낮은 조건부터
+    앞 조건을 통과한 행에 대해서만 평가합니다.
+    """
+    positions = np.arange(len(df), dtype=np.int64) if candidates is None else np.asarray(candidates, dtype=np.int64)
+
+    remaining = []
+    combined = None
+    for predicate in predicates:
+        bitmap = indexed_bitmap(df, predicate)
+        if bitmap is None:
+            remaining.append(predicate)
+        else:
+            combined = bitmap if combined is None else np.bitwise_and(combined, bitmap)
+    if combined is not None:
+        positions = positions[get_index('bitmaps').to_mask(combined)[positions]]
+
+    ordered = sorted(remaining, key=lambda predicate: estimate_selectivity(df, predicate, positions))
+    for predicate in ordered:
+        if len(positions) == 0:
+            break
+        positions = positions[evaluate_predicate(df, predicate, positions)]
+    return positions
+
+
+def select_rows_incremental(df, predicates, candidates, mask_cache):
+    """
+    조건별 마스크를 mask_cache(세션별 dict)에 보관해 두고, 값이 바뀐 조건만 다시 계산한 뒤 AND로 합칩니다.
+    데이터셋이나 후보 행이 바뀌면 보관해 둔 마스크를 모두 버립니다.
+    """
+    positions = np.arange(len(df), dtype=np.int64) if candidates is None else np.asarray(candidates, dtype=np.int64)
+    version = dataset_version('main') if df is get_dataset('main') else id(df)
+    base_key = (version, len(df), hashlib.blake2b(positions.tobytes(), digest_size=16).hexdigest())
+    if mask_cache.get('base') != base_key:
+        mask_cache.clear()
+        mask_cache['base'] = base_key
+
+    cached_masks = mask_cache.get('masks', {})
+    masks = {}
+    keep = np.ones(len(positions), dtype=bool)
+    for predicate in predicates:
+        key = (predicate.column, predicate.op, _normalize(predicate.value))
+        mask = cached_masks.get(key)
+        if mask is None:
+            bitmap = indexed_bitmap(df, predicate)
+            if bitmap is not None:
+                mask = get_index('bitmaps').to_mask(bitmap)[positions]
+            else:
+                mask = evaluate_predicate(df, predicate, positions)
+        masks[key] = mask
+        keep &= mask
+    # 현재 조건의 마스크만 남김
+    mask_cache['masks'] = masks
+    return positions[keep]
+
+
+def apply_predicates(df, predicates, candidates=None):
+    if not predicates and candidates is None:
+        return df
+    return df.take(select_rows(df, predicates, candidates))
+
+
+def option_filter_predicates(filters, student_info, columns):
+    predicates = []
+    for key, value in filters.items():
+        # 로드 시 계산해 둔 유효 컬럼이 있으면 그대로 사용
+        column = effective_column_name(key) if effective_column_name(key) in columns else key
+        if key == '2024년_경쟁률':
+            predicates.append(Predicate(column, '<=', value))
+        elif '경쟁률백분위' in key or '입결70%변동(%)' in key:
+            predicates.append(Predicate(column, '<', value))
+        elif '경쟁률변동(%)' in key or '충원율(%)' in key or '3개년_충원율_평균' in key:
+            predicates.append(Predicate(column, '>', value))
+        elif '3개년_입결70%_평균' in key:
+            predicates.append(Predicate(column, '>', student_info['adjusted_score'] * value))
+    return predicates
+
+
 def apply_filters(df, filters, student_info):
     if not filters:
         return df
 
-    for key, value in filters.items():
-        mask = pd.Series(True, index=df.index)
-        for idx, row in df.iterrows():
-            column_value = get_column_value(df, row, key)
-            if key == '2024년_경쟁률':
-                mask.loc[idx] = column_value <= value
-            elif '경쟁률백분위' in key or '입결70%변동(%)' in key:
-                mask.loc[idx] = column_value < value
-            elif '경쟁률변동(%)' in key or '충원율(%)' in key or '3개년_충원율_평균' in key:
-                mask.loc[idx] = column_value > value
-            elif '3개년_입결70%_평균' in key:
-                mask.loc[idx] = column_value > student_info['adjusted_score'] * value
-        df = df[mask]
-    return df
+    if '대체데이터사용' in df.columns and EFFECTIVE_SOURCE_COLUMN not in df.columns:
+        df = add_effective_columns(df.copy())
+    return apply_predicates(df, option_filter_predicates(filters, student_info, df.columns))
 
 
 def get_entry_score(row, filtered_data):
@@ -51,62 +213,218 @@ def get_entry_score(row, filtered_data):
         return entry_score_70
     elif pd.notna(entry_score_50) and entry_score_50 not in [0, -9999]:
         return entry_score_50
+    elif effective_column_name('2024년_입결70%') in row.index:
+        return row[effective_column_name('2024년_입결70%')]
     else:
         return get_column_value(filtered_data, row, '2024년_입결70%')
 
 
-def filter_data(student_info, data):
-    school_type = student_info['school_type']
-    adjustment_factor = SCHOOL_TYPE_ADJUSTMENT.get(school_type, 1.0)
-    adjusted_score = max(student_info['score'] * adjustment_factor, 1.00)
+def get_adjusted_score(student_info):
+    adjustment_factor = SCHOOL_TYPE_ADJUSTMENT.get(student_info['school_type'], 1.0)
+    return max(student_info['score'] * adjustment_factor, 1.00)
 
-    filtered_data = data[data['대학명'].isin([
-        univ for univ, range_info in university_ranges.items()
-        if range_info['min'] <= adjusted_score <= range_info['max']
-    ])]
 
-    filtered_data = filtered_data[filtered_data['2025년_모집인원'] > 0]
+def university_range_rows(data, adjusted_score):
+    range_index = get_index('university_ranges')
+    # 공유 데이터셋이면 미리 계산해 둔 행 번호를 바로 사용
+    if data is get_dataset('main'):
+        return range_index.rows(adjusted_score)
+    return np.flatnonzero(data['대학명'].isin(range_index.universities(adjusted_score)).to_numpy())
 
-    if '교과' in student_info['admission_type']:
-        filtered_data = filtered_data[filtered_data['전형구분'] == '교과']
-    else:
-        return pd.DataFrame()
+
+def student_predicates(student_info, admission_type):
+    predicates = [
+        Predicate('전형구분', '==', admission_type),
+        Predicate('2025년_모집인원', '>', 0)
+    ]
+    if admission_type == '종합':
+        predicates.append(Predicate('계열', 'in', list(student_info['field'])))
 
     if student_info['gender'] == '남자':
-        filtered_data = filtered_data[~filtered_data['대학명'].str.contains('여자')]
+        predicates.append(Predicate('대학명', 'not contains', '여자'))
 
-    if student_info['school_type'] == '과학고':
-        filtered_data = filtered_data[filtered_data['과학고'] == 1]
-    elif student_info['school_type'] == '전사고':
-        filtered_data = filtered_data[filtered_data['전사고'] == 1]
-    elif student_info['school_type'] == '외고':
-        filtered_data = filtered_data[filtered_data['외고'] == 1]
+    if student_info['school_type'] in ('과학고', '전사고', '외고'):
+        predicates.append(Predicate(student_info['school_type'], '==', 1))
+    return predicates
 
-    return filtered_data
 
+def search_range_predicates(student_info, search_range):
+    if search_range == "대계열 검색":
+        return [Predicate('계열', 'in', list(student_info['field']))]
+    elif search_range == "중계열 검색":
+        mid_categories = list(set([DETAIL_TO_MID_CATEGORY.get(field, "") for field in student_info['detail_fields']]))
+        return [Predicate('계열구분', 'in', mid_categories)]
+    elif search_range == "소계열 검색":
+        return [Predicate('계열상세명', 'contains any', list(student_info['detail_fields']))]
+    return []
 
-def filter_data_comprehensive(student_info, data):
-    school_type = student_info['school_type']
-    adjustment_factor = SCHOOL_TYPE_ADJUSTMENT.get(school_type, 1.0)
-    adjusted_score = max(student_info['score'] * adjustment_factor, 1.00)
 
-    filtered_data = data[data['대학명'].isin([
-        univ for univ, range_info in university_ranges.items()
-        if range_info['min'] <= adjusted_score <= range_info['max']
-    ])]
+def advanced_filter_predicates(filters):
+    predicates = []
+    for key, value in filters.items():
+        if key == '2024년_경쟁률':
+            predicates.append(Predicate(key, '<=', value))
+        elif isinstance(value, tuple):  # 범위 필터
+            predicates.append(Predicate(key, 'between', value))
+        elif key in ['2024년_경쟁률백분위', '2024년_입결70%', '2024년_입결50%']:
+            predicates.append(Predicate(key, 'between', value))
+        else:  # 단일 값 필터
+            predicates.append(Predicate(key, '>=', value))
+    return predicates
 
-    filtered_data = filtered_data[filtered_data['계열'].isin(student_info['field'])]
-    filtered_data = filtered_data[filtered_data['전형구분'] == '종합']
-    filtered_data = filtered_data[filtered_data['2025년_모집인원'] > 0]
 
-    if student_info['gender'] == '남자':
-        filtered_data = filtered_data[~filtered_data['대학명'].str.contains('여자')]
+def filter_by_search_range(df, student_info, search_range):
+    if df.empty:
+        return df
+    return apply_predicates(df, search_range_predicates(student_info, search_range))
+
+
+def apply_advanced_filters(df, filters):
+    return apply_predicates(df, advanced_filter_predicates(filters))
+
+
+def option_predicates(student_info, filters=None, lowest_ability_filter=False):
+    # 옵션 필터와 수능최저 조건 (검색 범위까지 적용한 행에 추가로 적용되는 조건)
+    predicates = advanced_filter_predicates(filters or {})
+    if lowest_ability_filter:
+        predicates.append(Predicate('2025년_수능최저코드', '<=', student_info['lowest_ability_code']))
+    return predicates
+
+
+def first_pass_predicates(student_info, admission_type, search_range=None, filters=None, lowest_ability_filter=False):
+    predicates = student_predicates(student_info, admission_type)
+    predicates += search_range_predicates(student_info, search_range)
+    predicates += option_predicates(student_info, filters, lowest_ability_filter)
+    return predicates
+
+
+def first_pass_cache_key(student_info, admission_type, search_range, filters, lowest_ability_filter):
+    """
+    1차 필터링 결과를 결정하는 값만 모은 캐시 키.
+    성적은 그대로 쓰지 않고 대학 범위 인덱스의 구간 번호로 바꿔, 같은 구간의 학생들이 결과를 공유합니다.
+    """
+    segment = get_index('university_ranges').segment(get_adjusted_score(student_info))
+    return (
+        admission_type,
+        segment,
+        student_info['school_type'],
+        student_info['gender'],
+        tuple(sorted(set(student_info['field']))),
+        tuple(sorted(set(student_info['detail_fields']))),
+        search_range,
+        _normalize(filters or {}),
+        student_info['lowest_ability_code'] if lowest_ability_filter else None,
+        dataset_version('main'),
+    )
+
+
+def order_rows_by_rank(df, rows):
+    """
+    행 번호를 대학 순위 순서로 정렬합니다. 공유 데이터셋이면 미리 만들어 둔 순위 순서 인덱스를 한 번 훑어 정렬 없이 계산합니다.
+    """
+    if df is get_dataset('main'):
+        order = get_index('rank_order')
+        selected = np.zeros(len(df), dtype=bool)
+        selected[rows] = True
+        return order[selected[order]]
+    if 'rank' not in df.columns:
+        return rows
+    return rows[np.argsort(df['rank'].to_numpy()[rows], kind='stable')]
+
+
+def first_pass_rows(student_info, data, admission_type, search_range=None, filters=None, lowest_ability_filter=False,
+                    mask_cache=None):
+    """
+    1차 필터링을 통과한 행 번호(대학 순위 순서). mask_cache를 넘기면 이전 실행의 조건별 마스크를 재사용합니다.
+    """
+    def compute():
+        candidates = university_range_rows(data, get_adjusted_score(student_info))
+        predicates = first_pass_predicates(student_info, admission_type, search_range, filters, lowest_ability_filter)
+        if mask_cache is None:
+            rows = select_rows(data, predicates, candidates)
+        else:
+            rows = select_rows_incremental(data, predicates, candidates, mask_cache)
+        rows = order_rows_by_rank(data, rows)
+        rows.setflags(write=False)  # 여러 세션이 공유하므로 읽기 전용
+        return rows
+
+    # 공유 데이터셋에 대한 결과만 세션 간에 캐시
+    if data is not get_dataset('main'):
+        return compute()
+    key = first_pass_cache_key(student_info, admission_type, search_range, filters, lowest_ability_filter)
+    return first_pass_cache.get_or_compute(key, compute)
+
+
+def filter_data(student_info, data, search_range=None, filters=None, lowest_ability_filter=False, mask_cache=None):
+    if '교과' not in student_info['admission_type']:
+        return pd.DataFrame()
+    return data.take(first_pass_rows(student_info, data, '교과', search_range, filters, lowest_ability_filter,
+                                     mask_cache))
+
+
+def filter_data_comprehensive(student_info, data, search_range=None, filters=None, lowest_ability_filter=False,
+                              mask_cache=None):
+    return data.take(first_pass_rows(student_info, data, '종합', search_range, filters, lowest_ability_filter,
+                                     mask_cache))
+
+
+class SliceCounter:
+    """
+    1차 필터링 대상 행(학생 조건과 검색 범위까지 적용한 행)에 대해 DataFrame을 만들지 않고
+    옵션 필터를 만족하는 모집단위 수와 대학 수만 셉니다. 범위 조건은 컬럼별로 정렬해 둔 값에서 이진 탐색으로 셉니다.
+    """
+
+    _RANGE_OPS = ('<', '<=', '>', '>=', 'between')
+
+    def __init__(self, df, rows):
+        self.df = df
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.total = len(self.rows)
+        self._university_codes = pd.factorize(df['대학명'])[0]
+        self._sorted = {}
+
+    def _sorted_column(self, column):
+        if column not in self._sorted:
+            values = pd.to_numeric(self.df[column].take(self.rows), errors='coerce').to_numpy(dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self._sorted[column] = (values[order], order)
+        return self._sorted[column]
+
+    def matching(self, predicate):
+        # 조건을 만족하는 행의 슬라이스 내 위치
+        if predicate.op in self._RANGE_OPS and pd.api.types.is_numeric_dtype(self.df[predicate.column]):
+            values, order = self._sorted_column(predicate.column)
+            start, end = 0, len(values)
+            if predicate.op == 'between':
+                start = np.searchsorted(values, predicate.value[0], side='left')
+                end = np.searchsorted(values, predicate.value[1], side='right')
+            elif predicate.op == '<':
+                end = np.searchsorted(values, predicate.value, side='left')
+            elif predicate.op == '<=':
+                end = np.searchsorted(values, predicate.value, side='right')
+            elif predicate.op == '>':
+                start = np.searchsorted(values, predicate.value, side='right')
+            else:
+                start = np.searchsorted(values, predicate.value, side='left')
+            return order[start:end]
+        return np.flatnonzero(evaluate_predicate(self.df, predicate, self.rows))
+
+    def count(self, predicate):
+        positions = self.matching(predicate)
+        return len(positions), len(np.unique(self._university_codes[self.rows[positions]]))
+
+    def count_all(self, predicates):
+        rows = select_rows(self.df, predicates, self.rows)
+        return len(rows), len(np.unique(self._university_codes[rows]))
 
-    if student_info['school_type'] == '과학고':
-        filtered_data = filtered_data[filtered_data['과학고'] == 1]
-    elif student_info['school_type'] == '전사고':
-        filtered_data = filtered_data[filtered_data['전사고'] == 1]
-    elif student_info['school_type'] == '외고':
-        filtered_data = filtered_data[filtered_data['외고'] == 1]
 
-    return filtered_data
+def eligible_counter(student_info, data, admission_type, search_range=None):
+    """
+    옵션 필터를 적용하기 전 행에 대한 SliceCounter. 공유 데이터셋이면 같은 조건의 세션끼리 공유합니다.
+    """
+    rows = first_pass_rows(student_info, data, admission_type, search_range)
+    if data is not get_dataset('main'):
+        return SliceCounter(data, rows)
+    key = first_pass_cache_key(student_info, admission_type, search_range, None, False)
+    return slice_counter_cache.get_or_compute(key, lambda: SliceCounter(data, rows))
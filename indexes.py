@@ -0,0 +1,185 @@
+# indexes.py
+# 공유 데이터셋(data_loader 레지스트리)에서 파생되는 검색용 인덱스
+# 인덱스는 처음 조회될 때 만들어지고, 데이터셋이 다시 등록되면 자동으로 새로 만들어집니다.
+import threading
+import numpy as np
+import pandas as pd
+from data_loader import register_index, university_ranges, percentile_column_name, percentile_source_columns
+from category_mapping import DETAIL_TO_MID_CATEGORY
+
+
+class UniversityRangeIndex:
+    """
+    university_ranges의 min/max 값을 정렬된 경계값으로 나눠 두고,
+    조정 성적이 속한 구간의 지원 가능 대학과 그 대학들의 행 번호를 이진 탐색으로 찾습니다.
+
+    구간 번호 2i는 경계값 breakpoints[i] 자체, 2i+1은 (breakpoints[i], breakpoints[i+1]) 사이를 뜻합니다.
+    """
+
+    def __init__(self, df, ranges):
+        self.breakpoints = np.array(sorted({value for info in ranges.values() for value in (info['min'], info['max'])}),
+                                    dtype=np.float64)
+        rows_by_university = df.groupby('대학명', observed=True, sort=False).indices
+        empty = np.array([], dtype=np.int64)
+
+        self.segment_universities = []
+        self.segment_rows = []
+        for segment in range(2 * len(self.breakpoints) - 1):
+            i = segment // 2
+            if segment % 2 == 0:
+                point = self.breakpoints[i]
+            else:
+                # 두 경계값 사이에서는 어느 점이든 포함되는 대학이 같으므로 중간값으로 판단
+                point = (self.breakpoints[i] + self.breakpoints[i + 1]) / 2
+            universities = tuple(univ for univ, info in ranges.items() if info['min'] <= point <= info['max'])
+            rows = [rows_by_university.get(univ, empty) for univ in universities]
+            self.segment_universities.append(universities)
+            self.segment_rows.append(np.sort(np.concatenate(rows)) if rows else empty)
+
+    def segment(self, score):
+        # 어떤 대학 구간에도 속하지 않으면 None
+        i = int(np.searchsorted(self.breakpoints, score, side='left'))
+        if i < len(self.breakpoints) and self.breakpoints[i] == score:
+            return 2 * i
+        if i == 0 or i == len(self.breakpoints):
+            return None
+        return 2 * i - 1
+
+    def universities(self, score):
+        segment = self.segment(score)
+        return () if segment is None else self.segment_universities[segment]
+
+    def rows(self, score):
+        segment = self.segment(score)
+        return np.array([], dtype=np.int64) if segment is None else self.segment_rows[segment]
+
+
+class DetailFieldIndex:
+    """
+    계열상세명의 역색인. 소계열 검색어(소문자)마다 그 검색어를 포함하는 계열상세명 행 번호 목록을 보관합니다.
+    세부 계열 목록(DETAIL_TO_MID_CATEGORY)의 단어는 미리 만들고, 그 밖의 검색어는 처음 조회할 때 만들어 둡니다.
+    """
+
+    def __init__(self, df, vocabulary):
+        # 행 단위 대신 서로 다른 계열상세명 값 단위로 부분 문자열을 검사
+        codes, values = pd.factorize(df['계열상세명'].astype(str).str.lower())
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        self._values = list(values)
+        self._rows_by_value = [order[boundaries[i]:boundaries[i + 1]] for i in range(len(values))]
+        self._postings = {}
+        self._lock = threading.Lock()
+        for term in vocabulary:
+            self.posting(term)
+
+    def posting(self, term):
+        term = str(term).lower()
+        if term not in self._postings:
+            rows = [self._rows_by_value[i] for i, value in enumerate(self._values) if term in value]
+            with self._lock:
+                self._postings[term] = np.sort(np.concatenate(rows)) if rows else np.array([], dtype=np.int64)
+        return self._postings[term]
+
+    def rows(self, terms):
+        # 검색어 중 하나라도 포함하는 행 번호 (posting list의 합집합)
+        postings = [self.posting(term) for term in terms]
+        if not postings:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(postings))
+
+
+# 값별 비트맵을 미리 만들어 둘 저카디널리티 컬럼
+BITMAP_COLUMNS = ['전형구분', '계열', '계열구분', '분류', '과학고', '전사고', '외고']
+
+
+class BitmapIndex:
+    """
+    필터에 자주 쓰이는 컬럼의 값별 비트맵을 np.packbits로 압축해 보관합니다.
+    같음/포함 조건은 문자열 비교 대신 비트맵의 AND/OR/NOT으로 계산합니다.
+    """
+
+    def __init__(self, df, columns):
+        self.size = len(df)
+        self._bitmaps = {}
+        for column in columns:
+            codes, values = pd.factorize(df[column])
+            for code, value in enumerate(values):
+                self._bitmaps[(column, value)] = np.packbits(codes == code)
+        # 컬럼 값이 아닌 자주 쓰는 조건
+        self._women_university = np.packbits(df['대학명'].astype(str).str.contains('여자', regex=False).to_numpy())
+        self._has_recruitment = np.packbits((df['2025년_모집인원'] > 0).to_numpy())
+        self._empty = np.zeros_like(self._has_recruitment)
+
+    def bitmap(self, column, value):
+        return self._bitmaps.get((column, value), self._empty)
+
+    def from_rows(self, rows):
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def to_mask(self, bitmap):
+        return np.unpackbits(bitmap, count=self.size).astype(bool)
+
+    def lookup(self, predicate):
+        """
+        조건에 해당하는 비트맵을 반환합니다. 이 인덱스로 계산할 수 없는 조건이면 None.
+        """
+        column, op, value = predicate
+        if column == '대학명' and op in ('contains', 'not contains') and value == '여자':
+            bitmap = self._women_university
+            return bitmap if op == 'contains' else np.invert(bitmap)
+        if column == '2025년_모집인원' and op == '>' and value == 0:
+            return self._has_recruitment
+        if column not in BITMAP_COLUMNS:
+            return None
+
+        if op in ('==', '!='):
+            bitmap = self.bitmap(column, value)
+        elif op in ('in', 'not in'):
+            bitmap = self._empty
+            for item in value:
+                bitmap = np.bitwise_or(bitmap, self.bitmap(column, item))
+        else:
+            return None
+        return bitmap if op in ('==', 'in') else np.invert(bitmap)
+
+
+class SortedColumnIndex:
+    """
+    숫자 컬럼마다 값으로 정렬한 배열과 그 행 번호를 보관해, 범위 조건을 이진 탐색으로 찾습니다.
+    빈 값(NaN)은 어떤 범위에도 포함되지 않습니다.
+    """
+
+    def __init__(self, df, columns):
+        self._sorted = {}
+        for column in columns:
+            if column not in df.columns:
+                continue
+            values = df[column].to_numpy(dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self._sorted[column] = (values[order], order)
+
+    def __contains__(self, column):
+        return column in self._sorted
+
+    def rows_between(self, column, low, high):
+        # low <= 값 <= high 인 행 번호 (값 순서)
+        values, order = self._sorted[column]
+        start = np.searchsorted(values, low, side='left')
+        end = np.searchsorted(values, high, side='right')
+        return order[start:end]
+
+
+def rank_order(df):
+    # rank 기준으로 안정 정렬한 행 번호. 행 집합을 이 순서로 훑으면 정렬 없이 순위 순서가 됩니다.
+    return np.argsort(df['rank'].to_numpy(), kind='stable')
+
+
+register_index('university_ranges', lambda df: UniversityRangeIndex(df, university_ranges))
+register_index('bitmaps', lambda df: BitmapIndex(df, BITMAP_COLUMNS))
+register_index('rank_order', rank_order)
+register_index('percentiles', lambda df: SortedColumnIndex(
+    df, [percentile_column_name(column) for column in percentile_source_columns()]))
+register_index('detail_fields', lambda df: DetailFieldIndex(df, DETAIL_TO_MID_CATEGORY.keys()))
@@ -0,0 +1,107 @@
+# llm_backend.py
+# 보고서 GPT 요청을 처리하는 백엔드
+# LLM_BACKEND 환경 변수로 고릅니다: 'openai'(기본값) 또는 'stub'(네트워크 없이 정해진 문구를 돌려주는 로컬 백엔드).
+# stub은 보고서 생성 전체 경로를 오프라인에서 측정하거나 부하 시험할 때 씁니다.
+# 백엔드의 cacheable이 False이면 응답을 디스크 캐시(llm_cache)에 읽고 쓰지 않습니다.
+import os
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+# .env의 API_KEY, LLM_* 설정을 다른 LLM 모듈보다 먼저 읽음
+load_dotenv()
+
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+LLM_STUB_LATENCY = float(os.getenv('LLM_STUB_LATENCY', 2.0))  # 초, stub 응답 한 건의 모의 지연 시간
+LLM_STUB_JITTER = float(os.getenv('LLM_STUB_JITTER', 0.5))  # 초, 프롬프트마다 정해지는 추가 지연의 최대값
+
+
+class OpenAIBackend:
+    """
+    OpenAI Chat Completions API. 클라이언트는 첫 요청 때 만듭니다.
+    재시도는 llm_dispatch에서 백오프와 함께 처리하므로 클라이언트 자체 재시도는 끕니다.
+    """
+
+    name = 'openai'
+    cacheable = True
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key or os.getenv('API_KEY'), max_retries=0)
+        return self._client
+
+    def complete(self, model, system_prompt, prompt, max_tokens, timeout):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        return response.choices[0].message.content
+
+
+class StubBackend:
+    """
+    네트워크 없이 정해진 형식의 문구를 돌려주는 백엔드.
+    같은 프롬프트에는 항상 같은 응답과 같은 지연 시간(latency + 프롬프트별 jitter)을 돌려줍니다.
+    """
+
+    name = 'stub'
+    cacheable = False  # 테스트 응답이 실제 응답 캐시에 섞이지 않도록
+
+    def __init__(self, latency=LLM_STUB_LATENCY, jitter=LLM_STUB_JITTER):
+        self.latency = latency
+        self.jitter = jitter
+
+    def complete(self, model, system_prompt, prompt, max_tokens, timeout):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        delay = self.latency + self.jitter * int(digest[:8], 16) / 0xFFFFFFFF
+        time.sleep(min(delay, timeout) if timeout else delay)
+        if timeout and delay > timeout:
+            raise TimeoutError(f"stub 응답 지연({delay:.1f}초)이 제한 시간({timeout:.1f}초)을 넘었습니다.")
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), '')
+        return (f"[{self.name}:{model}] 테스트 응답입니다. (프롬프트 {len(prompt)}자, {digest[:12]})\n"
+                f"요청: {first_line[:80]}\n"
+                "1. 분석\n이 문단은 오프라인 테스트용으로 만들어진 내용입니다.\n"
+                "2. 의견\n실제 분석 의견은 openai 백엔드에서 생성됩니다.")
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'stub': StubBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend():
+    # LLM_BACKEND에 해당하는 백엔드 (프로세스 전체에서 하나)
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if LLM_BACKEND not in BACKENDS:
+                    raise ValueError(f"알 수 없는 LLM_BACKEND: {LLM_BACKEND} (사용 가능: {', '.join(BACKENDS)})")
+                _backend = BACKENDS[LLM_BACKEND]()
+    return _backend
+
+
+def set_llm_backend(backend):
+    # 측정·시험용으로 백엔드를 직접 지정
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,138 @@
+# llm_cache.py
+# GPT 응답을 디스크(SQLite)에 보관하는 캐시
+# 같은 모델·같은 프롬프트의 응답은 학생이 달라도 재사용합니다 (인기 모집단위의 심층분석 등).
+# 전문지식(expert_knowledge.txt)이나 데이터셋 버전이 바뀌면 이전 응답은 자동으로 버려집니다.
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from data_loader import DATA_CACHE_DIR, dataset_version, expert_knowledge
+
+# 빈 문자열이면 캐시를 사용하지 않습니다.
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(DATA_CACHE_DIR, 'llm_responses.sqlite3'))
+LLM_CACHE_MAX_AGE = float(os.getenv('LLM_CACHE_MAX_AGE', 30 * 24 * 60 * 60))  # 초
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 5000))
+
+logger = logging.getLogger(__name__)
+
+
+def response_key(model, *messages):
+    # 모델 이름과 프롬프트 내용으로 만든 키 (내용이 같으면 같은 키)
+    digest = hashlib.sha256(model.encode('utf-8'))
+    for message in messages:
+        digest.update(b'\0')
+        digest.update(str(message).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_generation():
+    # 응답 내용에 영향을 주는 입력의 버전. 이 값이 다른 항목은 무효
+    digest = hashlib.sha256(expert_knowledge.encode('utf-8'))
+    digest.update(dataset_version('main').encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite 파일에 저장하는 응답 캐시.
+    max_age(초)가 지난 항목은 조회 시 무시하고, max_entries를 넘으면 가장 오래 사용하지 않은 항목부터 지웁니다.
+    디스크 오류가 나면 캐시가 없는 것처럼 동작합니다.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES, max_age=LLM_CACHE_MAX_AGE):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # 스레드마다 연결을 새로 엶 (sqlite3 연결은 스레드 간에 공유하지 않음)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, generation TEXT, response TEXT, created_at REAL, used_at REAL)")
+        return connection
+
+    def _invalidate_if_needed(self, connection):
+        generation = cache_generation()
+        if generation != self._generation:
+            connection.execute("DELETE FROM responses WHERE generation != ?", (generation,))
+            connection.commit()
+            self._generation = generation
+        return generation
+
+    def get(self, key):
+        if not self.path:
+            return None
+        try:
+            with self._lock:
+                connection = self._connect()
+                try:
+                    generation = self._invalidate_if_needed(connection)
+                    entry = connection.execute(
+                        "SELECT response, created_at FROM responses WHERE key = ? AND generation = ?",
+                        (key, generation)).fetchone()
+                    if entry is not None and time.time() - entry[1] > self.max_age:
+                        connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        entry = None
+                    if entry is not None:
+                        connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+                    connection.commit()
+                finally:
+                    connection.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("GPT 응답 캐시 조회 실패: %s", e)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, response):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with self._lock:
+                connection = self._connect()
+                try:
+                    generation = self._invalidate_if_needed(connection)
+                    now = time.time()
+                    connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                       (key, generation, response, now, now))
+                    connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age,))
+                    connection.execute(
+                        "DELETE FROM responses WHERE key NOT IN "
+                        "(SELECT key FROM responses ORDER BY used_at DESC LIMIT ?)", (self.max_entries,))
+                    connection.commit()
+                finally:
+                    connection.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.warning("GPT 응답 캐시 저장 실패: %s", e)
+
+    def clear(self):
+        if not self.path:
+            return
+        with self._lock:
+            connection = self._connect()
+            try:
+                connection.execute("DELETE FROM responses")
+                connection.commit()
+            finally:
+                connection.close()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'path': self.path, 'hits': self.hits, 'misses': self.misses}
+
+
+# 보고서의 GPT 응답 캐시 (모든 세션이 함께 사용)
+llm_response_cache = ResponseCache()
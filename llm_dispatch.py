@@ -0,0 +1,61 @@
+# llm_dispatch.py
+# GPT 요청을 동시에 보내기 위한 공유 스레드 풀
+# 모든 상담 세션이 같은 풀을 쓰므로 LLM_MAX_CONCURRENCY가 프로세스 전체의 동시 요청 수 상한이 됩니다.
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT', 60))  # 초, 요청 한 번의 제한 시간
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+LLM_RETRY_BACKOFF = float(os.environ.get('LLM_RETRY_BACKOFF', 1.0))  # 초, 재시도마다 두 배로 늘어남
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix='llm')
+
+
+def call_with_retries(func, *args, retries=LLM_MAX_RETRIES, backoff=LLM_RETRY_BACKOFF):
+    # 실패하면 backoff, 2*backoff, 4*backoff ... 초 기다린 뒤 다시 시도하고, 마지막 실패는 그대로 올립니다.
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            logger.warning("GPT 요청 실패 (%d/%d), %.1f초 후 재시도: %s", attempt + 1, retries + 1, delay, e)
+            time.sleep(delay)
+
+
+def submit_all(func, requests):
+    """
+    requests의 각 인자로 func를 공유 스레드 풀에서 실행하고, 요청 순서대로 Future 목록을 반환합니다.
+    func는 Streamlit이나 matplotlib을 건드리지 않아야 합니다.
+    """
+    return [_executor.submit(call_with_retries, func, request) for request in requests]
+
+
+def notify_completed(futures, notified, on_done):
+    # 이미 끝난 요청 중 아직 알리지 않은 요청으로 on_done(요청 번호, 실패 여부)를 호출 (기다리지 않음)
+    for i, future in enumerate(futures):
+        if i not in notified and future.done():
+            notified.add(i)
+            on_done(i, future.exception() is not None)
+
+
+def wait_in_completion_order(futures, on_done=None, notified=None):
+    """
+    끝나는 순서대로 on_done(요청 번호, 실패 여부)를 호출한 뒤, 결과를 요청 순서대로 반환합니다.
+    재시도 후에도 실패한 요청은 실패 여부 True로 알리고, 결과를 꺼낼 때 그 예외를 그대로 올립니다.
+    notified에 든 요청 번호는 notify_completed로 이미 알렸으므로 다시 알리지 않습니다.
+    on_done은 호출한 스레드에서 실행되므로 Streamlit 진행 표시를 갱신해도 됩니다.
+    """
+    notified = set() if notified is None else notified
+    positions = {future: i for i, future in enumerate(futures)}
+    for future in as_completed(futures):
+        if on_done is not None and positions[future] not in notified:
+            notified.add(positions[future])
+            on_done(positions[future], future.exception() is not None)
+    return [future.result() for future in futures]
@@ -5,8 +5,22 @@ import streamlit_authenticator as stauth
 st.set_page_config(page_title="지략 수시전략 컨설팅 지원 시스템", layout="wide")
 
 from tabs import info_input, subject_filtering, comprehensive_filtering, final_filtering, report_generation, direct_upload
-from data_loader import data, lowest_ability_codes
-from data_loader import load_data, lowest_ability_codes, additional_data
+from ui_components import run_tab_fragment
+
+# 탭 이름, 화면 함수, 다른 탭에서 만들어 이 탭이 읽는 세션 키
+# 각 탭은 독립적으로 다시 실행되고, 의존하는 키가 바뀔 때만 다른 탭의 변경에 맞춰 다시 그려집니다.
+TABS = [
+    ("정보입력", info_input.show_info_input, []),
+    ("교과 필터링", subject_filtering.show_subject_filtering, ['student_info']),
+    ("학종 필터링", comprehensive_filtering.show_comprehensive_filtering, ['student_info']),
+    ("최종 필터링", final_filtering.show_final_filtering,
+     ['subject_second_filter_ids', 'subject_new_or_advanced_filtered_ids',
+      'comprehensive_second_filter_ids', 'comprehensive_new_or_advanced_filtered_ids']),
+    ("보고서 작성", report_generation.show_report_generation,
+     ['student_info', 'final_selection_ids', 'subject_new_or_advanced_filtered_ids',
+      'comprehensive_new_or_advanced_filtered_ids']),
+    ("직접 데이터 업로드", direct_upload.show_direct_upload, []),
+]
 
 with open('config.yaml') as file:
     config = yaml.load(file, Loader=stauth.SafeLoader)
@@ -41,24 +55,14 @@ if authentication_status:
     def main():
         st.title("🖋️️ 지략 수시전략 컨설팅 지원 시스템 ")
         st.markdown("&nbsp;")
-        tabs = st.tabs(["정보입력", "교과 필터링", "학종 필터링", "최종 필터링", "보고서 작성", "직접 데이터 업로드"])
-        st.session_state['additional_data'] = additional_data
-        # 데이터 로드
-        if 'all_data' not in st.session_state:
-            st.session_state['all_data'] = load_data('data_240808_1735.xlsx')
-    
-        with tabs[0]:
-            info_input.show_info_input()
-        with tabs[1]:
-            subject_filtering.show_subject_filtering()
-        with tabs[2]:
-            comprehensive_filtering.show_comprehensive_filtering()
-        with tabs[3]:
-            final_filtering.show_final_filtering()
-        with tabs[4]:
-            report_generation.show_report_generation()
-        with tabs[5]:
-            direct_upload.show_direct_upload()
+        tabs = st.tabs([name for name, _, _ in TABS])
+        # 데이터는 data_loader의 공유 레지스트리에서 가져오므로 세션별로 복사해 두지 않습니다.
+
+        for i, (name, render, _) in enumerate(TABS):
+            # 이 탭이 바꾸면 다른 탭을 다시 그려야 하는 키
+            watched_keys = sorted({key for j, (_, _, depends_on) in enumerate(TABS) if j != i for key in depends_on})
+            with tabs[i]:
+                run_tab_fragment(name, render, watched_keys)
     
     if __name__ == "__main__":
         main()
@@ -0,0 +1,133 @@
+# prompt_builder.py
+# 보고서 GPT 프롬프트에 넣을 데이터를 섹션별 필요한 필드만 골라 간결한 표 형태로 만들고,
+# 보내기 전에 토큰 수를 세어 예산(PROMPT_TOKEN_BUDGET)을 넘으면 표의 뒤쪽 행부터 줄입니다.
+import os
+import logging
+import functools
+import numpy as np
+import pandas as pd
+
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 8000))
+
+logger = logging.getLogger(__name__)
+
+# 학생 정보 중 프롬프트에 넣을 항목 (내부 코드값 등은 제외)
+STUDENT_INFO_FIELDS = ['name', 'school_type', 'field', 'detail_fields', 'score', 'adjusted_score',
+                       'lowest_ability', 'non_subject_level', 'major_subjects_strong', 'admission_type']
+
+# 종합 의견: 전형 분포, 추천 대학의 경쟁률·입결·수능최저 설명에 쓰는 컬럼
+OVERALL_OPINION_COLUMNS = [
+    '대학명', '전형구분', '전형명', '모집단위', '2025년_모집인원', '전년대비2025년_모집인원변화', '2025년_최저요약',
+    '2024년_경쟁률', '3개년_경쟁률_평균', '2024년_입결70%', '3개년_입결70%_평균', '2024년_충원율(%)'
+]
+
+# 대학별 심층분석: 3개년 추이, 50%/70% 컷, 충원율, 모집인원·수능최저 변화, 계열 평균 비교에 쓰는 컬럼
+DETAILED_ANALYSIS_COLUMNS = [
+    '대학명', '전형구분', '전형명', '모집단위', '계열구분',
+    '2025년_모집인원', '2024년_모집인원', '2023년_모집인원', '전년대비2025년_모집인원변화',
+    '2025년_최저요약', '2024년_수능최저',
+    '2024년_경쟁률', '2023년_경쟁률', '2022년_경쟁률', '3개년_경쟁률_평균', '2024년_경쟁률변동(%)',
+    '2024년_입결70%', '2023년_입결70%', '2022년_입결70%', '3개년_입결70%_평균', '2024년_입결70%변동(%)',
+    '2024년_입결50%', '2023년_입결50%', '2022년_입결50%', '3개년_입결50%_평균',
+    '2024년_충원율(%)', '2023년_충원율(%)', '2022년_충원율(%)', '3개년_충원율_평균',
+    '2024년_계열경쟁률', '3개년_계열경쟁률_평균', '2024년_계열입결70%', '3개년_계열입결70%_평균',
+    '2024년_계열충원율(%)', '3개년_계열충원율_평균'
+]
+
+
+@functools.lru_cache(maxsize=None)
+def _token_encoding():
+    # tiktoken은 requirements.txt에 없는 선택 의존성: 설치돼 있으면 첫 토큰 계산 때 한 번만 불러옴
+    # (인코딩 파일을 내려받아야 할 수 있으므로 import 시점에는 불러오지 않음)
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:  # 설치돼 있지 않거나 인코딩 파일을 받을 수 없으면 근사치로 셈
+        logger.info("tiktoken 인코딩을 쓸 수 없어 근사치로 토큰 수를 셉니다: %s", e)
+        return None
+
+
+def count_tokens(text):
+    encoding = _token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # 근사치: 영문·숫자·기호는 4글자에 1토큰, 한글 등은 1글자에 1토큰 (실제보다 넉넉하게)
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def format_cell(value):
+    if isinstance(value, (list, tuple)):
+        return ', '.join(map(str, value))
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return '-'
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.2f}".rstrip('0').rstrip('.')
+    return str(value).replace('\n', ' ').replace('|', '/')
+
+
+def compact_record(record, fields):
+    # 한 행(또는 dict)을 '필드: 값' 줄로. 없는 필드는 생략
+    return '\n'.join(f"{field}: {format_cell(record[field])}" for field in fields if field in record)
+
+
+def table_lines(df, columns):
+    # 머리글 줄과 '|'로 구분한 행 줄 목록. 표가 비어 있으면 None
+    if df is None or df.empty:
+        return None
+    columns = [col for col in columns if col in df.columns]
+    rows = ['|'.join(format_cell(value) for value in row) for row in df[columns].itertuples(index=False)]
+    return '|'.join(columns), rows
+
+
+def join_table(lines, keep=None):
+    # table_lines의 결과에서 앞쪽 keep개 행만 남겨 표 문자열로. 뺀 행이 있으면 그 수를 덧붙임
+    if lines is None:
+        return '(없음)'
+    header, rows = lines
+    keep = len(rows) if keep is None else keep
+    text = '\n'.join([header] + rows[:keep])
+    if keep < len(rows):
+        text += f"\n(이하 {len(rows) - keep}개 행 생략)"
+    return text
+
+
+def compact_table(df, columns):
+    # 머리글 한 줄과 '|'로 구분한 행들
+    return join_table(table_lines(df, columns))
+
+
+def fit_prompt(build, tables, columns, budget=PROMPT_TOKEN_BUDGET):
+    """
+    tables(이름별 DataFrame)의 columns만 간결한 표 문자열로 바꿔 build(표 이름별 문자열)로 프롬프트를 만듭니다.
+    토큰 수가 budget을 넘으면 모든 표를 같은 행 수 이하로 뒤쪽부터 잘라 예산에 맞춥니다.
+    표는 중요한 행이 앞에 오도록 정렬해 두어야 합니다.
+
+    각 행과 표를 뺀 나머지 부분의 토큰 수는 한 번씩만 세고, 남길 행 수는 누적합에서 이분 탐색으로 정한 뒤
+    프롬프트를 한 번만 다시 만듭니다. (조각별 토큰 수의 합은 전체 토큰 수와 같거나 조금 큼)
+    """
+    lines = {name: table_lines(df, columns) for name, df in tables.items()}
+    sizes = {name: 0 if table is None else len(table[1]) for name, table in lines.items()}
+    prompt = build({name: join_table(table) for name, table in lines.items()})
+    if count_tokens(prompt) <= budget or not any(sizes.values()):
+        return prompt
+
+    # 행을 모두 뺀 프롬프트(생략 안내 포함)의 토큰 수와, 표별로 앞에서부터 행을 더할 때의 누적 토큰 수
+    fixed = count_tokens(build({name: join_table(table, 0) for name, table in lines.items()}))
+    prefix = {name: np.cumsum([0] + [count_tokens(row) + 1 for row in table[1]])
+              for name, table in lines.items() if table is not None}
+
+    def cost(limit):
+        return fixed + sum(int(sums[min(limit, sizes[name])]) for name, sums in prefix.items())
+
+    # 예산 안에 드는 가장 큰 표별 행 수 (최소 1행은 남김)
+    low, high = 1, max(sizes.values())
+    while low < high:
+        middle = (low + high + 1) // 2
+        if cost(middle) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    if cost(low) > budget:
+        logger.warning("프롬프트가 토큰 예산(%d)을 넘지만 더 줄일 행이 없습니다.", budget)
+    return build({name: join_table(table, min(low, sizes[name])) for name, table in lines.items()})
@@ -0,0 +1,148 @@
+# report_progress.py
+# 보고서 생성 진행 상황
+# 실제 파이프라인 단계(전처리, 프롬프트 작성, 종합 의견, 대학별 심층분석, 대학별 그래프, 상세 표, 핵심정리, 업로드)가 끝날 때마다
+# 진행률과 경과 시간, 남은 예상 시간을 알려 줍니다.
+import threading
+import time
+from contextlib import contextmanager
+
+# 단계 종류별 예상 소요 시간(초). 보고서를 만들 때마다 실제 소요 시간으로 갱신됩니다.
+DEFAULT_STAGE_SECONDS = {
+    '전처리': 1.0,
+    '프롬프트 작성': 1.0,
+    '종합 의견': 20.0,
+    '대학별 심층분석': 20.0,
+    '대학별 그래프': 1.5,
+    '상세 표': 1.0,
+    '핵심정리': 1.0,
+    '업로드': 5.0,
+}
+# 새 소요 시간을 예상치에 반영하는 비율 (지수 이동 평균)
+STAGE_SECONDS_SMOOTHING = 0.3
+# 동시에 실행되는 단계 종류. GPT 요청은 요청마다, 대학별 그래프는 메인 스레드에서 차례로 그리므로 종류 전체가
+# 하나의 흐름이 되고, 이 단계들은 합이 아니라 가장 늦게 끝날 흐름 기준으로 계산
+CONCURRENT_STAGE_KINDS = {'종합 의견', '대학별 심층분석', '대학별 그래프'}
+# 동시에 실행되는 단계 중 같은 종류끼리는 차례로 실행되는 종류
+SERIAL_STAGE_KINDS = {'대학별 그래프'}
+
+_stage_seconds = dict(DEFAULT_STAGE_SECONDS)
+_stage_seconds_lock = threading.Lock()
+
+
+def expected_seconds(kind):
+    with _stage_seconds_lock:
+        return _stage_seconds.get(kind, 1.0)
+
+
+def record_stage_seconds(kind, seconds):
+    with _stage_seconds_lock:
+        previous = _stage_seconds.get(kind)
+        _stage_seconds[kind] = seconds if previous is None else \
+            (1 - STAGE_SECONDS_SMOOTHING) * previous + STAGE_SECONDS_SMOOTHING * seconds
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 60}분 {seconds % 60}초" if seconds >= 60 else f"{seconds}초"
+
+
+class ReportProgress:
+    """
+    보고서 생성 단계 목록과 진행 상황.
+    stages는 (단계 종류, 표시 이름) 목록이고, on_update(진행률 0~1, 안내 문구)는 단계가 시작하거나 끝날 때 호출됩니다.
+    남은 시간은 끝나지 않은 순차 단계의 예상 소요 시간 합에, 동시에 실행되는 단계(CONCURRENT_STAGE_KINDS)의
+    흐름 중 가장 늦게 끝날 흐름의 남은 시간을 더해 계산합니다.
+    예상 시간은 시작할 때 고정해 두므로 진행 중에 진행률이 뒤로 가지 않습니다.
+    """
+
+    def __init__(self, stages, on_update=None):
+        self.stages = list(stages)
+        self.on_update = on_update
+        self._estimates = {label: expected_seconds(kind) for kind, label in self.stages}
+        self._concurrent = {label for kind, label in self.stages if kind in CONCURRENT_STAGE_KINDS}
+        # 동시에 실행되는 흐름별 단계 목록. SERIAL_STAGE_KINDS는 종류별로 한 흐름, 나머지는 단계마다 한 흐름
+        self._lanes = {}
+        for kind, label in self.stages:
+            if kind in CONCURRENT_STAGE_KINDS:
+                self._lanes.setdefault(kind if kind in SERIAL_STAGE_KINDS else label, []).append(label)
+        self.started_at = time.monotonic()
+        self._stage_started = {}
+        self._finished = set()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def _stage_remaining(self, label, now):
+        if label in self._finished:
+            return 0.0
+        started = self._stage_started.get(label)
+        spent = now - started if started is not None else 0.0
+        return max(self._estimates[label] - spent, 0.0)
+
+    def _progress(self):
+        # (전체 예상 시간, 끝난 만큼의 예상 시간, 남은 예상 시간)
+        now = time.monotonic()
+        with self._lock:
+            sequential = [label for _, label in self.stages if label not in self._concurrent]
+            total = sum(self._estimates[label] for label in sequential)
+            done = sum(self._estimates[label] for label in sequential if label in self._finished)
+            remaining = sum(self._stage_remaining(label, now) for label in sequential)
+            if self._lanes:
+                concurrent_total = max(sum(self._estimates[label] for label in lane) for lane in self._lanes.values())
+                concurrent_remaining = max(sum(self._stage_remaining(label, now) for label in lane)
+                                           for lane in self._lanes.values())
+                total += concurrent_total
+                done += concurrent_total - concurrent_remaining
+                remaining += concurrent_remaining
+        return total, done, remaining
+
+    def fraction(self):
+        total, done, _ = self._progress()
+        return done / total if total else 1.0
+
+    def remaining(self):
+        return self._progress()[2]
+
+    def start(self, label):
+        with self._lock:
+            self._stage_started.setdefault(label, time.monotonic())
+        self._notify(f"{label} 중")
+
+    def finish(self, label, failed=False):
+        # 실패한 단계는 닫기만 하고 소요 시간을 예상치에 반영하지 않음
+        now = time.monotonic()
+        with self._lock:
+            started = self._stage_started.get(label, now)
+            self._finished.add(label)
+            kind = next((kind for kind, name in self.stages if name == label), None)
+        if kind is not None and not failed:
+            record_stage_seconds(kind, now - started)
+        self._notify(f"{label} {'실패' if failed else '완료'}")
+
+    @contextmanager
+    def stage(self, label):
+        self.start(label)
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.finish(label, failed=failed)
+
+    def message(self, status):
+        return f"{status} · 경과 {format_seconds(self.elapsed())} · 남은 예상 {format_seconds(self.remaining())}"
+
+    def _notify(self, status):
+        if self.on_update is not None:
+            self.on_update(min(self.fraction(), 1.0), self.message(status))
+
+
+def report_stages(analysis_labels, chart_labels):
+    # 대학별 심층분석(GPT 요청)과 대학별 그래프는 분석할 대학마다 한 단계
+    return ([('전처리', '전처리'), ('프롬프트 작성', '프롬프트 작성'), ('종합 의견', '종합 의견')] +
+            [('대학별 심층분석', label) for label in analysis_labels] +
+            [('대학별 그래프', label) for label in chart_labels] +
+            [('상세 표', '상세 표'), ('핵심정리', '핵심정리'), ('업로드', '업로드')])
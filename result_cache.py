@@ -0,0 +1,105 @@
+# result_cache.py
+# 세션 사이에 공유되는 결과 캐시
+# 같은 조건의 1차 필터링 결과(행 번호 배열)를 여러 상담 세션이 함께 사용합니다.
+import os
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from data_loader import dataset_version
+
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 512))
+RESULT_CACHE_MAX_AGE = float(os.environ.get('RESULT_CACHE_MAX_AGE', 6 * 60 * 60))  # 초
+
+
+class LRUCache:
+    """
+    최근에 사용한 순서로 항목을 유지하는 캐시.
+    max_entries를 넘으면 가장 오래 사용하지 않은 항목부터, max_age(초)가 지난 항목은 조회 시 제거합니다.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, max_age=RESULT_CACHE_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (저장 시각, 값)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.max_age:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        # 계산은 잠금 밖에서 수행하므로, 동시에 같은 키를 처음 요청하면 각자 계산할 수 있습니다.
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def row_ids_key(row_ids, name='main'):
+    """
+    행 번호 배열을 캐시 키로 변환합니다. 데이터셋 버전과 배열 내용의 해시를 사용하므로 프레임 전체를 해싱하지 않습니다.
+    """
+    row_ids = np.ascontiguousarray(row_ids, dtype=np.int64)
+    return dataset_version(name), len(row_ids), hashlib.blake2b(row_ids.tobytes(), digest_size=16).hexdigest()
+
+
+def cached_by_key(cache, make_key):
+    """
+    make_key(*args, **kwargs)로 만든 키로 함수 결과를 cache에 보관하는 데코레이터.
+    결과 배열은 여러 세션이 공유하므로 읽기 전용으로 저장합니다.
+    """
+    def decorator(func):
+        prefix = (func.__module__, func.__qualname__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            def compute():
+                value = func(*args, **kwargs)
+                if isinstance(value, np.ndarray):
+                    value.setflags(write=False)
+                return value
+            return cache.get_or_compute(prefix + tuple(make_key(*args, **kwargs)), compute)
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+# 1차 필터링 결과 캐시 (프로세스 전체에서 공유)
+first_pass_cache = LRUCache()
+# 옵션 필터 건수 미리보기용 SliceCounter 캐시
+slice_counter_cache = LRUCache(max_entries=128)
+# 2차 필터링/최종 필터링 단계 결과(행 번호) 캐시
+stage_cache = LRUCache(max_entries=256)
@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
 from data_loader import data as all_data, SCHOOL_TYPE_ADJUSTMENT, lowest_ability_codes, lowest_ability_ui_options, \
-    classify_data, remove_duplicates
+    classify_data, remove_duplicates, read_excel_cached, get_dataset
 from tabs.report_generation import generate_report, needed_columns
 import numpy as np
-import time
 
 def preprocess_data(df):
     if df is None or df.empty:
@@ -45,7 +44,7 @@ def show_direct_upload():
     uploaded_file = st.file_uploader("최종 선택 데이터 엑셀 파일 업로드", type="xlsx")
 
     if uploaded_file is not None:
-        user_data = pd.read_excel(uploaded_file)
+        user_data = read_excel_cached(uploaded_file)
         st.success("파일 업로드 완료")
 
         # 기본 정보 입력
@@ -145,10 +144,8 @@ def show_direct_upload():
                 st.warning("학생 정보를 먼저 입력해주세요.")
             else:
                 with st.spinner("보고서 작성 중입니다..."):
-                    progress_bar = st.progress(0)
-                    for i in range(100):
-                        time.sleep(1)
-                        progress_bar.progress(i + 1)
+                    # 실제 생성 단계가 끝날 때마다 진행률과 남은 예상 시간을 갱신
+                    progress_bar = st.progress(0, text="보고서 준비 중")
 
                     final_selection, new_advanced_data = process_uploaded_data(user_data, all_data)
 
@@ -156,7 +153,8 @@ def show_direct_upload():
                     st.session_state['user_new_advanced_data'] = new_advanced_data
 
                     html, tables, file_id = generate_report(final_selection, st.session_state['user_student_info'],
-                                                            all_data, st.session_state['additional_data'])
+                                                            all_data, get_dataset('additional'),
+                                                            on_progress=progress_bar.progress)
 
                 st.success("보고서 생성이 완료되었습니다!")
                 st.components.v1.html(html, height=600, scrolling=True)
@@ -1,88 +1,131 @@
 import streamlit as st
 import pandas as pd
-from data_loader import ranking
-
-def sort_universities(df, sort_option, sort_order):
-    ascending = (sort_order == '오름차순')
-    if sort_option == '경쟁률 백분위':
-        return df.sort_values('2024년_경쟁률백분위', ascending=ascending)
-    elif sort_option == '경쟁률':
-        return df.sort_values('2024년_경쟁률', ascending=ascending)
-    elif sort_option == '3개년 경쟁률 백분위 평균':
-        return df.sort_values('3개년_경쟁률_평균', ascending=ascending)
-    elif sort_option == '입결70% 변동(%)':
-        return df.sort_values('2024년_입결70%변동(%)', ascending=ascending)
-    elif sort_option == '3개년 입결70% 평균':
-        return df.sort_values('3개년_입결70%_평균', ascending=ascending)
-    elif sort_option == '충원율(%)':
-        return df.sort_values('2024년_충원율(%)', ascending=ascending)
-    elif sort_option == '3개년 충원율 평균':
-        return df.sort_values('3개년_충원율_평균', ascending=ascending)
-    elif sort_option == '수능최저':
-        return df.sort_values('2025년_수능최저코드', ascending=ascending)
-    elif sort_option == '입결70%':
-        return df.sort_values('2024년_입결70%', ascending=ascending)
-    elif sort_option == '입결50%':
-        return df.sort_values('2024년_입결50%', ascending=ascending)
-    else:
-        return df
+import numpy as np
+from data_loader import effective_column_name, sort_by_rank, RANKING_POSITION, take_rows, \
+    row_ids, EMPTY_ROW_IDS, percentile_column_name
+from result_cache import cached_by_key, row_ids_key, stage_cache
+from ui_components import selection_grid, project_view, flash_success
+
+# 리스트별 최대 대학 수
+FINAL_LIST_MAX_UNIVERSITIES = 20
+
+# 정렬 옵션별 정렬 기준 컬럼
+SORT_COLUMNS = {
+    '경쟁률 백분위': '2024년_경쟁률백분위',
+    '경쟁률': '2024년_경쟁률',
+    '경쟁률 변동(%)': '2024년_경쟁률변동(%)',
+    '3개년 경쟁률 백분위 평균': percentile_column_name('3개년_경쟁률_평균'),
+    '입결70% 변동(%)': '2024년_입결70%변동(%)',
+    '3개년 입결70% 평균': '3개년_입결70%_평균',
+    '충원율(%)': '2024년_충원율(%)',
+    '3개년 충원율 평균': '3개년_충원율_평균',
+    '수능최저': '2025년_수능최저코드',
+    '입결70%': '2024년_입결70%',
+    '입결50%': '2024년_입결50%'
+}
+
+
+def get_sort_column(df, sort_option):
+    column = SORT_COLUMNS.get(sort_option)
+    if column is not None and effective_column_name(column) in df.columns:
+        return effective_column_name(column)
+    return column
+
+
+def sort_key_values(df, sort_option, sort_order):
+    """
+    작은 값이 먼저 오도록 변환한 정렬 기준 값. 내림차순이면 부호를 바꾸고, 빈 값은 항상 뒤로 갑니다.
+    """
+    column = get_sort_column(df, sort_option)
+    if column is None or column not in df.columns:
+        return np.zeros(len(df))
+    values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+    return values if sort_order == '오름차순' else -values
+
+
+def top_k_positions(keys, k):
+    """
+    keys가 작은 순서로 최대 k개의 위치를 정렬된 순서로 반환합니다. 전체를 정렬하지 않고 argpartition으로 고릅니다.
+    """
+    if k is None or k >= len(keys):
+        return np.argsort(keys, kind='stable')
+    selected = np.argpartition(keys, k - 1)[:k]
+    return selected[np.argsort(keys[selected], kind='stable')]
+
+
+def order_final_rows(df, sort_option, sort_order, max_universities=None, max_rows_per_university=None):
+    """
+    (대학 순위, 정렬 기준) 순서의 행 위치를 한 번의 lexsort로 계산합니다.
+    max_universities는 순위 상위 대학 수, max_rows_per_university는 대학별 최대 행 수를 제한합니다.
+    """
+    codes, universities = pd.factorize(df['대학명'].astype(object), use_na_sentinel=False)
+    university_count = len(universities)
+    university_rank = np.zeros(university_count, dtype=np.int64)
+    university_rank[codes] = df['rank'].to_numpy()
+
+    # 순위가 같은 대학(순위 목록에 없는 대학)은 처음 나온 순서로 구분
+    university_keys = university_rank * university_count + np.arange(university_count)
+    selected = top_k_positions(university_keys, max_universities)
+    university_order = np.full(university_count, university_count, dtype=np.int64)
+    university_order[selected] = np.arange(len(selected))
+
+    row_university = university_order[codes]
+    order = np.lexsort((sort_key_values(df, sort_option, sort_order), row_university))
+    order = order[row_university[order] < university_count]
+
+    if max_rows_per_university is not None and len(order):
+        groups = row_university[order]
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        position_in_group = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        order = order[position_in_group < max_rows_per_university]
+    return order
 
 def order_by_ranking(df):
     if '대학명' not in df.columns:
         st.warning("데이터프레임에 '대학명' 열이 없습니다.")
         return df
 
-    df['ranking'] = df['대학명'].apply(lambda x: ranking.index(x) if x in ranking else len(ranking))
-    return df.sort_values('ranking').drop('ranking', axis=1)
-
-def reorder_columns(df):
-    first_columns = ['선택', '대학명', '모집단위', '2024년_입결50%', '2024년_입결70%', '2024년_경쟁률', '전형명', '2025년_모집인원', '2024년_충원율(%)', '2025년_최저요약']
-    excluded_columns = ['No.', '계열상세']
-    other_columns = [col for col in df.columns if col not in first_columns + excluded_columns]
-    return df[first_columns + other_columns]
-
-@st.cache_data
-def apply_final_filtering(general_data, sort_option, sort_order):
-    if not general_data.empty:
-        # 대학 랭킹에 따라 정렬
-        ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-        general_data['temp_ranking'] = general_data['대학명'].map(ranking_dict).fillna(len(ranking))
-        general_data = general_data.sort_values('temp_ranking')
-
-        # 각 대학 내에서 정렬 기준 적용
-        sorted_general = general_data.groupby('대학명', group_keys=False).apply(
-            lambda x: sort_universities(x, sort_option, sort_order)
-        )
-
-        sorted_general['선택'] = False
-        sorted_general['구분'] = '일반'
-        sorted_general = reorder_columns(sorted_general)
-        return sorted_general.drop('temp_ranking', axis=1)
-    return pd.DataFrame()
-
-
-@st.cache_data
-def prepare_new_advanced_data(new_advanced_data):
-    if not new_advanced_data.empty:
-        sorted_new_advanced = order_by_ranking(new_advanced_data)
-        sorted_new_advanced['선택'] = True
-        sorted_new_advanced['구분'] = '신설/첨단'
-        sorted_new_advanced = reorder_columns(sorted_new_advanced)
-        return sorted_new_advanced
-    return pd.DataFrame()
+    return sort_by_rank(df)
+
+def _final_filtering_key(general_ids, sort_option, sort_order, max_universities=FINAL_LIST_MAX_UNIVERSITIES,
+                         max_rows_per_university=None):
+    return row_ids_key(general_ids), sort_option, sort_order, max_universities, max_rows_per_university
+
+
+@cached_by_key(stage_cache, _final_filtering_key)
+def apply_final_filtering(general_ids, sort_option, sort_order, max_universities=FINAL_LIST_MAX_UNIVERSITIES,
+                          max_rows_per_university=None):
+    general_data = take_rows(general_ids)
+    if general_data.empty:
+        return EMPTY_ROW_IDS
+    # 대학 랭킹 순서로, 각 대학 안에서는 정렬 기준 순서로
+    order = order_final_rows(general_data, sort_option, sort_order, max_universities, max_rows_per_university)
+    return general_ids[order]
+
+
+@cached_by_key(stage_cache, lambda new_advanced_ids: (row_ids_key(new_advanced_ids),))
+def prepare_new_advanced_data(new_advanced_ids):
+    return row_ids(order_by_ranking(take_rows(new_advanced_ids)))
+
+
+def final_result_frame(key, ids):
+    # 최종 결과 행 번호를 화면에 표시할 프레임으로
+    df = take_rows(ids)
+    df['구분'] = '신설/첨단' if '신설첨단' in key else '일반'
+    return df
 
 
 def show_final_filtering():
     st.info("교과, 학종 필터링 결과를 조건에 따라 정렬하여 리스트별 최대 20개의 대학을 선정합니다.")
 
-    if 'subject_second_filter_results' not in st.session_state or 'comprehensive_second_filter_results' not in st.session_state:
+    if 'subject_second_filter_ids' not in st.session_state or 'comprehensive_second_filter_ids' not in st.session_state:
         st.warning("교과 필터링과 학종 필터링을 먼저 완료해주세요.")
         return
 
-    subject_general = st.session_state['subject_second_filter_results']
-    subject_new_advanced = st.session_state['subject_new_or_advanced_filtered']
-    comprehensive_general = st.session_state['comprehensive_second_filter_results']
-    comprehensive_new_advanced = st.session_state['comprehensive_new_or_advanced_filtered']
+    subject_general = st.session_state['subject_second_filter_ids']
+    subject_new_advanced = st.session_state['subject_new_or_advanced_filtered_ids']
+    comprehensive_general = st.session_state['comprehensive_second_filter_ids']
+    comprehensive_new_advanced = st.session_state['comprehensive_new_or_advanced_filtered_ids']
 
     if st.button("전형별 저장 데이터 보기"):
         st.markdown("---")
@@ -90,22 +133,22 @@ def show_final_filtering():
         st.subheader("1️⃣  전형별 저장 데이터 보기")
 
         st.subheader("📚 교과 지원 리스트")
-        if not subject_general.empty:
+        if len(subject_general):
             st.write("일반 학과")
-            st.dataframe(reorder_columns(subject_general))
-        if not subject_new_advanced.empty:
+            st.dataframe(project_view(take_rows(subject_general), 'saved_list'), hide_index=True)
+        if len(subject_new_advanced):
             st.write("신설/첨단 학과")
-            st.dataframe(reorder_columns(subject_new_advanced))
+            st.dataframe(project_view(take_rows(subject_new_advanced), 'saved_list'), hide_index=True)
 
         st.markdown("<hr style='border-top: 3px dashed #bbb;'>", unsafe_allow_html=True)
 
         st.subheader("📋 학종 지원 리스트")
-        if not comprehensive_general.empty:
+        if len(comprehensive_general):
             st.write("일반 학과")
-            st.dataframe(reorder_columns(comprehensive_general))
-        if not comprehensive_new_advanced.empty:
+            st.dataframe(project_view(take_rows(comprehensive_general), 'saved_list'), hide_index=True)
+        if len(comprehensive_new_advanced):
             st.write("신설/첨단 학과")
-            st.dataframe(reorder_columns(comprehensive_new_advanced))
+            st.dataframe(project_view(take_rows(comprehensive_new_advanced), 'saved_list'), hide_index=True)
 
     admission_types = ['교과', '학종']
     sort_options = [
@@ -161,36 +204,25 @@ def show_final_filtering():
             final_results[admission_type] = apply_final_filtering(general_data, sort_option, sort_order)
             final_results[f'{admission_type}_신설첨단'] = prepare_new_advanced_data(new_advanced_data)
 
-        st.session_state['final_results'] = final_results
+        # 세션에는 리스트별 행 번호만 저장
+        st.session_state['final_result_ids'] = final_results
         st.success("최종 필터링이 적용되었습니다.")
 
-    if 'final_results' in st.session_state:
+    if 'final_result_ids' in st.session_state:
         st.subheader("최종 필터링 결과")
-        for i, (key, df) in enumerate(st.session_state['final_results'].items()):
+        for i, (key, ids) in enumerate(st.session_state['final_result_ids'].items()):
             if '신설첨단' not in key:
+                df = final_result_frame(key, ids)
                 emoji = "📚" if key == "교과" else "📋"
                 title = f"**{emoji} {'교과' if key == '교과' else '종합'} 전형 최종 리스트**"
                 st.write(title)
+                # ranking 리스트에 있는 대학만 순위 순서로 출력 (일반 학과는 선택 해제 상태로 시작)
+                df = sort_by_rank(df[df['대학명'].isin(list(RANKING_POSITION))])
                 if not df.empty:
-                    # ranking 리스트의 순서대로 대학을 출력
-                    for univ in ranking:
-                        if univ in df['대학명'].unique():
-                            st.write(f"**{univ}**")
-                            univ_df = df[df['대학명'] == univ]
-                            edited_df = st.data_editor(
-                                univ_df,
-                                hide_index=True,
-                                column_config={
-                                    "선택": st.column_config.CheckboxColumn(
-                                        "선택",
-                                        help="이 행을 선택하려면 체크하세요"
-                                    )
-                                },
-                                disabled=univ_df.columns.drop('선택'),
-                                key=f"editor_{key}_{univ}"
-                            )
-                            st.session_state[f'final_displayed_{key}_{univ}'] = edited_df
+                    st.session_state[f'final_selected_ids_{key}'] = selection_grid(
+                        df, key=f'final_{key}', view='final_grid', default_selected=False)
                 else:
+                    st.session_state[f'final_selected_ids_{key}'] = EMPTY_ROW_IDS
                     st.write("데이터가 없습니다.")
 
                 # 교과 전형과 종합 전형 사이에 줄바꿈과 구분선 추가
@@ -200,51 +232,31 @@ def show_final_filtering():
                     st.markdown("<br>", unsafe_allow_html=True)  # 줄바꿈
 
         # 신설 및 첨단학과 표시
-        for key, df in st.session_state['final_results'].items():
+        for key, ids in st.session_state['final_result_ids'].items():
             if '신설첨단' in key:
+                df = final_result_frame(key, ids)
                 emoji = "🔬" if '교과' in key else "🧬"
                 title = f"**{emoji} {'교과' if '교과' in key else '종합'} 전형 신설 및 첨단학과**"
                 st.write(title)
                 if not df.empty:
-                    edited_df = st.data_editor(
-                        df,
-                        hide_index=True,
-                        column_config={
-                            "선택": st.column_config.CheckboxColumn(
-                                "선택",
-                                help="이 행을 선택하려면 체크하세요"
-                            )
-                        },
-                        disabled=df.columns.drop('선택'),
-                        key=f"editor_{key}"
-                    )
-                    st.session_state[f'final_displayed_{key}'] = edited_df
+                    st.session_state[f'final_selected_ids_{key}'] = selection_grid(
+                        df, key=f'final_{key}', view='final_grid', default_selected=True)
                 else:
+                    st.session_state[f'final_selected_ids_{key}'] = EMPTY_ROW_IDS
                     st.write("데이터가 없습니다.")
 
 
     if st.button("리스트 확정", key='confirm_final_list_button'):
         final_selection = {}
-        for key in st.session_state['final_results'].keys():
-            if '신설첨단' in key:
-                if f'final_displayed_{key}' in st.session_state:
-                    df = st.session_state[f'final_displayed_{key}']
-                    selected_df = df[df['선택']]
-                    if not selected_df.empty:
-                        final_selection[key] = selected_df
-            else:
-                selected_df = pd.DataFrame()
-                for univ in st.session_state['final_results'][key]['대학명'].unique():
-                    if f'final_displayed_{key}_{univ}' in st.session_state:
-                        univ_df = st.session_state[f'final_displayed_{key}_{univ}']
-                        selected_df = pd.concat([selected_df, univ_df[univ_df['선택']]])
-                if not selected_df.empty:
-                    final_selection[key] = selected_df
+        for key in st.session_state.get('final_result_ids', {}):
+            selected_ids = st.session_state.get(f'final_selected_ids_{key}', EMPTY_ROW_IDS)
+            if len(selected_ids):
+                final_selection[key] = selected_ids
 
         if final_selection:
-            st.session_state['final_selection'] = final_selection
-            counts = {key: len(df) for key, df in final_selection.items()}
-            st.success(
+            st.session_state['final_selection_ids'] = final_selection
+            counts = {key: len(ids) for key, ids in final_selection.items()}
+            flash_success(
                 f"교과 {counts.get('교과', 0)}개, 학종 {counts.get('학종', 0)}개, "
                 f"교과 신설첨단 {counts.get('교과_신설첨단', 0)}개, 학종 신설첨단 {counts.get('학종_신설첨단', 0)}개 "
                 f"저장 완료되었습니다.")
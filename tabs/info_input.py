@@ -1,5 +1,6 @@
 import streamlit as st
 from data_loader import lowest_ability_codes, SCHOOL_TYPE_ADJUSTMENT, lowest_ability_ui_options
+from ui_components import flash_success
 
 def show_info_input():
     st.markdown(
@@ -87,8 +88,7 @@ def show_info_input():
             'admission_type': admission_type
         }
 
-        st.success("아래와 같이 정보 입력이 완료되었습니다. 교과 필터링 탭으로 이동하세요.")
-        st.write(st.session_state['student_info'])
+        flash_success("아래와 같이 정보 입력이 완료되었습니다. 교과 필터링 탭으로 이동하세요.")
 
         st.markdown("""
             <style>
@@ -99,5 +99,9 @@ def show_info_input():
             </style>
             """, unsafe_allow_html=True)
 
+    # 입력을 마친 정보는 버튼을 누른 실행이 아니어도(앱 전체 재실행 후에도) 계속 표시
+    if 'student_info' in st.session_state:
+        st.write(st.session_state['student_info'])
+
 if __name__ == "__main__":
     show_info_input()
\ No newline at end of file
@@ -4,14 +4,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import io
 import base64
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
 import matplotlib.font_manager as fm
 import numpy as np
-import time
 from data_loader import expert_knowledge
 import datetime
+import functools
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
@@ -19,14 +17,16 @@ from google.oauth2 import service_account
 import matplotlib as mpl
 from matplotlib.backends.backend_svg import FigureCanvasSVG
 from data_loader import university_groups, get_university_group, get_group_universities
-from data_loader import ranking
+from data_loader import get_dataset, effective_column_name, effective_value, sort_by_rank, take_rows, EMPTY_ROW_IDS
+from report_progress import ReportProgress, report_stages
+# llm_backend가 .env를 읽으므로 다른 LLM 모듈보다 먼저 가져옴
+from llm_backend import get_llm_backend
+from llm_dispatch import submit_all, notify_completed, wait_in_completion_order, LLM_REQUEST_TIMEOUT
+from llm_cache import llm_response_cache, response_key
+from prompt_builder import fit_prompt, compact_record, STUDENT_INFO_FIELDS, OVERALL_OPINION_COLUMNS, \
+    DETAILED_ANALYSIS_COLUMNS
 
 
-# 환경 변수 로드 및 OpenAI 클라이언트 설정
-load_dotenv()
-api_key = os.getenv('API_KEY')
-client = OpenAI(api_key=api_key)
-
 # 한글 폰트 설정
 font_path = 'KoPubDotumLight.ttf'
 font_prop = fm.FontProperties(fname=font_path)
@@ -61,7 +61,7 @@ def set_font_for_all_axes(fig):
 def format_value(value):
     if pd.isna(value):
         return '-'
-    elif isinstance(value, float):
+    elif isinstance(value, (float, np.floating)):
         return f"{value:.2f}"
     return str(value)
 
@@ -109,7 +109,9 @@ needed_columns = [
     '2024년_계열경쟁률', '2023년_계열경쟁률', '2022년_계열경쟁률',
     '2024년_계열입결70%', '2023년_계열입결70%', '2022년_계열입결70%', '2024년_계열입결70%변동(%)',
     '2024년_계열충원율(%)', '2023년_계열충원율(%)', '2022년_계열충원율(%)',
-    '3개년_계열경쟁률_평균', '3개년_계열입결70%_평균', '3개년_계열충원율_평균', '2024년_계열충원율변동(%)'
+    '3개년_계열경쟁률_평균', '3개년_계열입결70%_평균', '3개년_계열충원율_평균', '2024년_계열충원율변동(%)',
+    effective_column_name('2024년_경쟁률'), effective_column_name('2024년_입결70%'),
+    effective_column_name('2024년_충원율(%)')
 ]
 
 
@@ -121,7 +123,7 @@ def generate_overall_opinion_prompt(student_info, university_list, university_da
     {expert_knowledge}
     
     학생 정보:
-    {student_info}
+    {compact_record(student_info, STUDENT_INFO_FIELDS)}
     
     지원 가능 대학 목록:
     {university_list}  
@@ -306,21 +308,74 @@ def generate_detailed_analysis_prompt(university_info, admission_data, compariso
     return prompt
 
 
-def generate_gpt_response(prompt):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system",
-             "content": "You are a helpful assistant that generates reports based on university admission data. Please refer to the expert knowledge provided in the prompt when answering. Answer in Korean."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1000
-    )
+GPT_MODEL = "gpt-4o-mini"
+GPT_SYSTEM_PROMPT = "You are a helpful assistant that generates reports based on university admission data. Please refer to the expert knowledge provided in the prompt when answering. Answer in Korean."
+GPT_MAX_TOKENS = 1000
+
+
+def generate_gpt_response(prompt, timeout=LLM_REQUEST_TIMEOUT, use_cache=True):
+    # 같은 백엔드·모델·프롬프트의 응답이 디스크 캐시에 있으면 요청하지 않음
+    # 학생 개인정보가 들어간 프롬프트는 use_cache=False로 보내 디스크에 남기지 않음
+    # stub 등 cacheable이 아닌 백엔드의 응답도 캐시하지 않음
+    backend = get_llm_backend()
+    use_cache = use_cache and backend.cacheable
+    key = response_key(f"{backend.name}/{GPT_MODEL}", GPT_SYSTEM_PROMPT, GPT_MAX_TOKENS, prompt)
+    if use_cache:
+        cached = llm_response_cache.get(key)
+        if cached is not None:
+            return cached
+
+    content = backend.complete(GPT_MODEL, GPT_SYSTEM_PROMPT, prompt, GPT_MAX_TOKENS, timeout)
     # GPT 응답의 줄바꿈을 HTML <br> 태그로 변환
-    return response.choices[0].message.content.strip().replace('\n', '<br>')
+    result = content.strip().replace('\n', '<br>')
+    if use_cache:
+        llm_response_cache.put(key, result)
+    return result
+
+
+def group_comparison(row, all_data):
+    # 같은 그룹·전형구분·계열구분 대학들의 2024년 계열 지표 (분석 대상 대학은 모집단위 값으로 대체)
+    university = row['대학명']
+    group_data = all_data[
+        (all_data['그룹'] == row['그룹']) &
+        (all_data['전형구분'] == row['전형구분']) &
+        (all_data['계열구분'] == row['계열구분'])
+        ]
+
+    group_competition_rates = group_data.groupby('대학명', observed=True)['2024년_계열경쟁률'].first()
+    group_competition_rates[university] = effective_value(row, '2024년_경쟁률')
+
+    group_entrance_scores = group_data.groupby('대학명', observed=True)['2024년_계열입결70%'].first()
+    group_entrance_scores[university] = effective_value(row, '2024년_입결70%')
+
+    group_fill_rates = group_data.groupby('대학명', observed=True)['2024년_계열충원율(%)'].first()
+    group_fill_rates[university] = effective_value(row, '2024년_충원율(%)')
+
+    # 비교 데이터 생성
+    comparison_data = pd.DataFrame({
+        '대학명': group_competition_rates.index,
+        '경쟁률': group_competition_rates.values,
+        '입결70%': group_entrance_scores.values,
+        '충원율(%)': group_fill_rates.values
+    })
+    comparison_data = comparison_data.sort_values('대학명')
+    return group_competition_rates, group_entrance_scores, group_fill_rates, comparison_data
+
+
+def university_analysis_prompt(row, all_data, admission_type):
+    university_info = f"{row['대학명']} {row['모집단위']} {admission_type} 전형"
+    admission_data = compact_record(row, DETAILED_ANALYSIS_COLUMNS)
+    comparison_data = group_comparison(row, all_data)[3]
+    # 분석 대상 대학을 맨 앞에 두어 토큰 예산 때문에 행을 줄여도 남도록
+    is_target = comparison_data['대학명'] == row['대학명']
+    comparison_data = pd.concat([comparison_data[is_target], comparison_data[~is_target]])
+    return fit_prompt(
+        lambda tables: generate_detailed_analysis_prompt(university_info, admission_data, tables['비교']),
+        {'비교': comparison_data}, list(comparison_data.columns))
 
 
 def analyze_university(row, all_data, index, admission_type, student_info):
+    # 그래프와 비교 표까지. GPT 분석 의견은 university_opinion_html로 뒤에 붙임
     html = f"<h3>{index}. {row['대학명']} {row['모집단위']} - {admission_type} 전형</h3>"
 
     # 경쟁률 분석
@@ -480,33 +535,7 @@ def analyze_university(row, all_data, index, admission_type, student_info):
     html += "<h4>다른학교 같은 계열들과의 비교</h4>"
 
     university = row['대학명']
-    group = row['그룹']
-    current_admission_type = row['전형구분']
-    current_field_type = row['계열구분']
-
-    group_data = all_data[
-        (all_data['그룹'] == group) &
-        (all_data['전형구분'] == current_admission_type) &
-        (all_data['계열구분'] == current_field_type)
-        ]
-
-    group_competition_rates = group_data.groupby('대학명')['2024년_계열경쟁률'].first()
-    group_competition_rates[university] = row['2024년_경쟁률']
-
-    group_entrance_scores = group_data.groupby('대학명')['2024년_계열입결70%'].first()
-    group_entrance_scores[university] = row['2024년_입결70%']
-
-    group_fill_rates = group_data.groupby('대학명')['2024년_계열충원율(%)'].first()
-    group_fill_rates[university] = row['2024년_충원율(%)']
-
-    # 비교 데이터 생성
-    comparison_data = pd.DataFrame({
-        '대학명': group_competition_rates.index,
-        '경쟁률': group_competition_rates.values,
-        '입결70%': group_entrance_scores.values,
-        '충원율(%)': group_fill_rates.values
-    })
-    comparison_data = comparison_data.sort_values('대학명')
+    group_competition_rates, group_entrance_scores, group_fill_rates, _ = group_comparison(row, all_data)
 
     # 시각화
     fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(20, 5))
@@ -565,71 +594,108 @@ def analyze_university(row, all_data, index, admission_type, student_info):
     html += f"</tr>"
     html += "</table>"
 
+    return html
+
+
+def university_opinion_html(insight):
     # 분석 및 의견
-    html += "<h4>분석 및 의견</h4>"
-    university_info = f"{row['대학명']} {row['모집단위']} {admission_type} 전형"
-    admission_data = row.to_dict()
-    gpt_insight_prompt = generate_detailed_analysis_prompt(university_info, admission_data, comparison_data)
-    gpt_insight_response = generate_gpt_response(gpt_insight_prompt)
-    html += f"<p>{gpt_insight_response}</p>"
+    html = "<h4>분석 및 의견</h4>"
+    html += f"<p>{insight}</p>"
 
     html += "<hr>"
 
     return html
 
 
-def generate_university_list(final_selection):
-    html = ""
-    for category, proportion in [("소신", 0.3), ("적정", 0.7)]:
-        category_html = f"<h3>{category}:</h3>"
-        category_has_data = False
-        for admission_type in ['교과', '학종']:
-            if admission_type in final_selection and not final_selection[admission_type].empty:
-                df = final_selection[admission_type]
-                if category == "소신":
-                    filtered_df = df.head(int(len(df) * proportion))
-                else:
-                    filtered_df = df.tail(int(len(df) * (1 - proportion)))
-
-                if not filtered_df.empty:
-                    category_has_data = True
-                    category_html += f"<h4>{admission_type} 전형:</h4>"
-                    category_html += "<ul>"
-                    for _, row in filtered_df.iterrows():
-                        category_html += f"<li>{row['대학명']} {row['모집단위']}</li>"
-                    category_html += "</ul>"
+# 전형별 선택 목록의 앞쪽 30%는 소신, 나머지는 적정 지원
+STRONG_CHOICE_PROPORTION = 0.3
 
-        if category_has_data:
-            html += category_html
 
-    return html
+def with_university_category(df):
+    # 선택 목록에 소신/적정 구분 열을 붙임 (목록은 랭킹순으로 정렬돼 있음)
+    if df is None or df.empty:
+        return df
+    strong = int(len(df) * STRONG_CHOICE_PROPORTION)
+    return df.assign(구분=np.where(np.arange(len(df)) < strong, '소신', '적정'))
 
 
-def generate_report(final_selection, student_info, all_data, additional_data):
-    with open("header.png", "rb") as image_file:
-        encoded_header = base64.b64encode(image_file.read()).decode()
+def generate_university_list(final_selection):
+    # 전형별 소신/적정 모집단위 수. 모집단위별 구분은 지원 대학 데이터의 '구분' 열로 넣으므로 목록을 따로 반복하지 않음
+    lines = []
+    for admission_type in ['교과', '학종']:
+        df = final_selection.get(admission_type)
+        if df is not None and not df.empty:
+            strong = int(len(df) * STRONG_CHOICE_PROPORTION)
+            lines.append(f"{admission_type} 전형: {len(df)}개 (소신 {strong}개, 적정 {len(df) - strong}개)")
+    if not lines:
+        return "(없음)"
+    lines.append("(모집단위별 소신/적정은 아래 지원 대학 데이터의 '구분' 열 참고)")
+    return '\n'.join(lines)
+
+
+def overall_opinion_prompt(final_selection, student_info):
+    # 종합 의견에 필요한 컬럼만 간결한 표로 넣고, 토큰 예산을 넘으면 랭킹이 낮은 행부터 생략
+    university_list = generate_university_list(final_selection)
+    tables = {admission_type: with_university_category(final_selection.get(admission_type))
+              for admission_type in ['교과', '학종']}
+    return fit_prompt(
+        lambda tables: generate_overall_opinion_prompt(student_info, university_list, '\n'.join(
+            f"[{name}]\n{table}" for name, table in tables.items())),
+        tables, ['구분'] + OVERALL_OPINION_COLUMNS)
 
-    with open("KoPubDotumLight.ttf", "rb") as font_file:
-        encoded_font = base64.b64encode(font_file.read()).decode()
 
-    # 데이터 전처리 부분 수정
-    processed_data = {}
+def analysis_targets(final_selection):
+    # 대학별 심층분석 대상: 전형별 랭킹 상위 3개 대학의 (전형, 순번, 행)
+    targets = []
     for admission_type in ['교과', '학종']:
         if admission_type in final_selection and not final_selection[admission_type].empty:
             df = final_selection[admission_type]
-            total_count = len(df)
-            sincere_count = int(total_count * 0.3)
-            processed_data[admission_type] = {
-                'sincere': df.head(sincere_count),
-                'appropriate': df.tail(total_count - sincere_count)
-            }
-        else:
-            processed_data[admission_type] = {
-                'sincere': pd.DataFrame(),
-                'appropriate': pd.DataFrame()
-            }
+            df_grouped = df.groupby('대학명', observed=True).first().reset_index()
+            df_top_3 = sort_by_rank(df_grouped).head(3)
+            for i, (_, row) in enumerate(df_top_3.iterrows()):
+                targets.append((admission_type, i + 1, row))
+    return targets
+
+
+def analysis_label(admission_type, row):
+    return f"{admission_type} {row['대학명']} 심층분석"
 
 
+def chart_label(admission_type, row):
+    return f"{admission_type} {row['대학명']} 그래프 작성"
+
+
+def generate_report(final_selection, student_info, all_data, additional_data, on_progress=None):
+    """
+    보고서 HTML을 만들고 Google Drive에 올립니다.
+    on_progress(진행률, 안내 문구)가 있으면 각 단계가 시작하고 끝날 때마다 호출합니다.
+    """
+    targets = analysis_targets(final_selection)
+    progress = ReportProgress(report_stages([analysis_label(t, row) for t, _, row in targets],
+                                            [chart_label(t, row) for t, _, row in targets]), on_progress)
+    with progress.stage('전처리'):
+        with open("header.png", "rb") as image_file:
+            encoded_header = base64.b64encode(image_file.read()).decode()
+
+        with open("KoPubDotumLight.ttf", "rb") as font_file:
+            encoded_font = base64.b64encode(font_file.read()).decode()
+
+        # 데이터 전처리 부분 수정
+        processed_data = {}
+        for admission_type in ['교과', '학종']:
+            if admission_type in final_selection and not final_selection[admission_type].empty:
+                df = final_selection[admission_type]
+                total_count = len(df)
+                sincere_count = int(total_count * 0.3)
+                processed_data[admission_type] = {
+                    'sincere': df.head(sincere_count),
+                    'appropriate': df.tail(total_count - sincere_count)
+                }
+            else:
+                processed_data[admission_type] = {
+                    'sincere': pd.DataFrame(),
+                    'appropriate': pd.DataFrame()
+                }
 
     html = f"""
     <!DOCTYPE html>
@@ -787,13 +853,33 @@ def generate_report(final_selection, student_info, all_data, additional_data):
     </div>
     """
 
-    university_data = {
-        '교과': final_selection.get('교과', pd.DataFrame()).to_dict('records'),
-        '학종': final_selection.get('학종', pd.DataFrame()).to_dict('records')
-    }
-    university_list = generate_university_list(final_selection)
-    gpt_prompt = generate_overall_opinion_prompt(student_info, university_list, university_data)
-    gpt_response = generate_gpt_response(gpt_prompt)
+    with progress.stage('프롬프트 작성'):
+        gpt_prompt = overall_opinion_prompt(final_selection, student_info)
+        analysis_prompts = [university_analysis_prompt(row, all_data, admission_type)
+                            for admission_type, _, row in targets]
+
+    # 종합 의견과 대학별 분석 의견은 서로 독립적이므로 한꺼번에 요청하고,
+    # 응답을 기다리는 동안 이 스레드에서 대학별 그래프를 그림 (matplotlib은 메인 스레드에서만 사용)
+    # 종합 의견 프롬프트에는 학생 정보가 들어가므로 응답 캐시를 거치지 않고, 대학별 분석 의견만 캐시함
+    labels = ['종합 의견'] + [analysis_label(admission_type, row) for admission_type, _, row in targets]
+    for label in labels:
+        progress.start(label)
+    futures = (submit_all(functools.partial(generate_gpt_response, use_cache=False), [gpt_prompt]) +
+               submit_all(generate_gpt_response, analysis_prompts))
+    finish_request = lambda i, failed: progress.finish(labels[i], failed=failed)
+    notified = set()
+    chart_sections = []
+    for admission_type, index, row in targets:
+        with progress.stage(chart_label(admission_type, row)):
+            chart_sections.append(analyze_university(row, all_data, index, admission_type, student_info))
+        # 그래프를 그리는 동안 끝난 요청을 바로 반영
+        notify_completed(futures, notified, finish_request)
+    responses = wait_in_completion_order(futures, on_done=finish_request, notified=notified)
+    gpt_response = responses[0]
+    # 응답은 요청 순서대로 돌아오므로 각 대학 섹션에 그대로 이어 붙임
+    analysis_sections = [charts + university_opinion_html(insight)
+                         for charts, insight in zip(chart_sections, responses[1:])]
+
     html += f"""
             <div class="section">
                 <h2>종합 의견 📝</h2>
@@ -811,150 +897,143 @@ def generate_report(final_selection, student_info, all_data, additional_data):
         </div>
     """
 
-    def sort_by_ranking(df):
-        ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-        df['ranking'] = df['대학명'].map(ranking_dict).fillna(len(ranking))
-        return df.sort_values('ranking').drop('ranking', axis=1)
-
     for admission_type in ['교과', '학종']:
         html += f"<div class='admission-type-box'>{admission_type if admission_type == '교과' else '종합'} 전형</div>"
 
-        if admission_type in final_selection and not final_selection[admission_type].empty:
-            df = final_selection[admission_type]
-            df_grouped = df.groupby('대학명').first().reset_index()
-            df_sorted = sort_by_ranking(df_grouped)
-            df_top_3 = df_sorted.head(3)
-
-            for i, (_, row) in enumerate(df_top_3.iterrows()):
-                html += analyze_university(row, all_data, i + 1, admission_type, student_info)
+        sections = [section for (target_type, _, _), section in zip(targets, analysis_sections)
+                    if target_type == admission_type]
+        if sections:
+            for section in sections:
+                html += section
         else:
             html += f"<p>{admission_type if admission_type == '교과' else '종합'} 전형에서 추천하는 대학이 없습니다.</p>"
 
     html += "</div>"
 
-    tables = generate_detailed_tables(processed_data)
-
-    html += "<br>"  # 구분선 전 줄바꿈 추가
-    html += "<hr style='border-top: 2px solid #bbb;'>"
-    html += "<br>"  # 구분선 후 줄바꿈 추가
-    html += "<div class='section'>"
-    html += "<h2>지원 가능안 상세 📋</h2>"
-    for i, table in enumerate(tables):
-        html += f"<div class='admission-type-box'>{table['title'] if '교과' in table['title'] else '종합 전형'}</div>"
-        if table['data'] is not None and not table['data'].empty:
-            html += f"<div class='detailed-table'>{table['data'].to_html(index=False)}</div>"
-        else:
-            html += f"<p>{table['title'].split()[0]} 전형에서 추천하는 대학이 없습니다.</p>"
+    with progress.stage('상세 표'):
+        tables = generate_detailed_tables(processed_data)
+
+        html += "<br>"  # 구분선 전 줄바꿈 추가
+        html += "<hr style='border-top: 2px solid #bbb;'>"
+        html += "<br>"  # 구분선 후 줄바꿈 추가
+        html += "<div class='section'>"
+        html += "<h2>지원 가능안 상세 📋</h2>"
+        for i, table in enumerate(tables):
+            html += f"<div class='admission-type-box'>{table['title'] if '교과' in table['title'] else '종합 전형'}</div>"
+            if table['data'] is not None and not table['data'].empty:
+                html += f"<div class='detailed-table'>{table['data'].to_html(index=False)}</div>"
+            else:
+                html += f"<p>{table['title'].split()[0]} 전형에서 추천하는 대학이 없습니다.</p>"
 
-        # 교과 전형과 종합 전형 사이에 줄바꿈 추가
-        if i == 0:  # 첫 번째 테이블(교과 전형) 후에 줄바꿈 추가
-            html += "<br>"
+            # 교과 전형과 종합 전형 사이에 줄바꿈 추가
+            if i == 0:  # 첫 번째 테이블(교과 전형) 후에 줄바꿈 추가
+                html += "<br>"
 
 
-    html += "</div>"
-
-    html += "<br>"
-    html += "<hr style='border-top: 2px solid #bbb;'>"
-    html += "<br>"
-    html += "<div class='section'>"
-    html += "<h2>대학별 2025학년도 핵심정리 🎓</h2>"
-
-    # 교과와 학종 데이터를 안전하게 결합
-    all_filtered_data = pd.concat([
-        final_selection.get('교과', pd.DataFrame()),
-        final_selection.get('학종', pd.DataFrame())
-    ], ignore_index=True)
-
-    if not all_filtered_data.empty and '대학명' in all_filtered_data.columns:
-        ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-        all_filtered_data['ranking'] = all_filtered_data['대학명'].map(ranking_dict)
-        all_filtered_data = all_filtered_data.sort_values('ranking').drop('ranking', axis=1)
-        unique_universities = all_filtered_data.drop_duplicates(subset=['대학명', '전형구분', '전형명'])
-    else:
-        unique_universities = pd.DataFrame(columns=['대학명', '전형구분', '전형명'])
-
-    for admission_type in ['교과', '종합']:
-        html += f"<div class='admission-type-box'>{admission_type} 전형</div>"
-        filtered_universities = unique_universities[unique_universities['전형구분'] == admission_type]
-
-        if not filtered_universities.empty:
-            for _, row in filtered_universities.iterrows():
-                match = additional_data[(additional_data['대학명'] == row['대학명']) &
-                                        (additional_data['전형구분'] == row['전형구분']) &
-                                        (additional_data['전형명'] == row['전형명'])]
-                if not match.empty:
-                    html += f"<h4 style='border-bottom: 1px solid var(--table-border-color); padding-bottom: 5px;'>{row['대학명']} - {row['전형명']}</h4>"
-                    core_summary = match.iloc[0]['2025학년도_핵심정리']
-                    core_summary_html = core_summary.replace('\n', '<br>')
-                    html += f"<p style='margin-left: 20px;'>{core_summary_html}</p>"
-        else:
-            html += "<p>추천한 대학, 전형과 관련된 특이사항만 표시합니다.</p>"
+        html += "</div>"
 
+    with progress.stage('핵심정리'):
+        html += "<br>"
+        html += "<hr style='border-top: 2px solid #bbb;'>"
         html += "<br>"
+        html += "<div class='section'>"
+        html += "<h2>대학별 2025학년도 핵심정리 🎓</h2>"
+
+        # 교과와 학종 데이터를 안전하게 결합
+        all_filtered_data = pd.concat([
+            final_selection.get('교과', pd.DataFrame()),
+            final_selection.get('학종', pd.DataFrame())
+        ], ignore_index=True)
+
+        if not all_filtered_data.empty and '대학명' in all_filtered_data.columns:
+            all_filtered_data = sort_by_rank(all_filtered_data)
+            unique_universities = all_filtered_data.drop_duplicates(subset=['대학명', '전형구분', '전형명'])
+        else:
+            unique_universities = pd.DataFrame(columns=['대학명', '전형구분', '전형명'])
+
+        for admission_type in ['교과', '종합']:
+            html += f"<div class='admission-type-box'>{admission_type} 전형</div>"
+            filtered_universities = unique_universities[unique_universities['전형구분'] == admission_type]
+
+            if not filtered_universities.empty:
+                for _, row in filtered_universities.iterrows():
+                    match = additional_data[(additional_data['대학명'] == row['대학명']) &
+                                            (additional_data['전형구분'] == row['전형구분']) &
+                                            (additional_data['전형명'] == row['전형명'])]
+                    if not match.empty:
+                        html += f"<h4 style='border-bottom: 1px solid var(--table-border-color); padding-bottom: 5px;'>{row['대학명']} - {row['전형명']}</h4>"
+                        core_summary = match.iloc[0]['2025학년도_핵심정리']
+                        core_summary_html = core_summary.replace('\n', '<br>')
+                        html += f"<p style='margin-left: 20px;'>{core_summary_html}</p>"
+            else:
+                html += "<p>추천한 대학, 전형과 관련된 특이사항만 표시합니다.</p>"
 
-    html += "</div>"
+            html += "<br>"
 
+        html += "</div>"
 
-    # 신설/첨단융합학과 정보 추가
-    html += "<hr style='border-top: 2px solid #bbb;'>"
-    html += "<div class='section'>"
-    html += "<br>"  # 줄바꿈과 공백 추가
-    html += "<h2>대학별 신설/첨단융합학과 🔬</h2>"
 
-    column_mapping = {
-        '대학명': '대학명',
-        '전형명': '전형명',
-        '모집단위': '모집단위',
-        '2025년_모집인원': '모집인원',
-        '2025년_최저요약': '수능최저',
-        '2024년_경쟁률': '24 경쟁률',
-        '2023년_경쟁률': '23 경쟁률',
-        '2024년_입결70%': '24 입결70%',
-        '2024년_충원율(%)': '24 충원율(%)'
-    }
+        # 신설/첨단융합학과 정보 추가
+        html += "<hr style='border-top: 2px solid #bbb;'>"
+        html += "<div class='section'>"
+        html += "<br>"  # 줄바꿈과 공백 추가
+        html += "<h2>대학별 신설/첨단융합학과 🔬</h2>"
 
-    for i, admission_type in enumerate(['교과', '학종']):
-        html += f"<div class='admission-type-box'>{admission_type if admission_type == '교과' else '종합'} 전형</div>"
+        column_mapping = {
+            '대학명': '대학명',
+            '전형명': '전형명',
+            '모집단위': '모집단위',
+            '2025년_모집인원': '모집인원',
+            '2025년_최저요약': '수능최저',
+            '2024년_경쟁률': '24 경쟁률',
+            '2023년_경쟁률': '23 경쟁률',
+            '2024년_입결70%': '24 입결70%',
+            '2024년_충원율(%)': '24 충원율(%)'
+        }
 
-        if f'{admission_type}_신설첨단' in final_selection:
-            df = final_selection[f'{admission_type}_신설첨단'].copy()
+        for i, admission_type in enumerate(['교과', '학종']):
+            html += f"<div class='admission-type-box'>{admission_type if admission_type == '교과' else '종합'} 전형</div>"
 
-            if not df.empty:
-                # 추천한 대학과 전형에 관련된 신설/첨단학과만 필터링
-                recommended_universities = set(
-                    final_selection[admission_type]['대학명']) if admission_type in final_selection else set()
-                df = df[df['대학명'].isin(recommended_universities)]
+            if f'{admission_type}_신설첨단' in final_selection:
+                df = final_selection[f'{admission_type}_신설첨단'].copy()
 
                 if not df.empty:
-                    df = df.fillna('-')
-                    columns_to_display = ['대학명', '전형명', '모집단위', '모집인원',
-                                          '수능최저', '24 경쟁률', '23 경쟁률', '24 입결70%', '24 충원율(%)']
-                    df.columns = [column_mapping.get(col, col) for col in df.columns]
-                    columns_to_display = [col for col in columns_to_display if col in df.columns]
-                    html += f"<div class='detailed-table'>{df[columns_to_display].to_html(index=False)}</div>"
+                    # 추천한 대학과 전형에 관련된 신설/첨단학과만 필터링
+                    recommended_universities = set(
+                        final_selection[admission_type]['대학명']) if admission_type in final_selection else set()
+                    df = df[df['대학명'].isin(recommended_universities)]
+
+                    if not df.empty:
+                        df = df.astype(object).fillna('-')
+                        columns_to_display = ['대학명', '전형명', '모집단위', '모집인원',
+                                              '수능최저', '24 경쟁률', '23 경쟁률', '24 입결70%', '24 충원율(%)']
+                        df.columns = [column_mapping.get(col, col) for col in df.columns]
+                        columns_to_display = [col for col in columns_to_display if col in df.columns]
+                        html += f"<div class='detailed-table'>{df[columns_to_display].to_html(index=False)}</div>"
+                    else:
+                        html += "<p>추천한 대학, 전형과 관련된 신설/첨단학과만 표시합니다.</p>"
                 else:
                     html += "<p>추천한 대학, 전형과 관련된 신설/첨단학과만 표시합니다.</p>"
             else:
                 html += "<p>추천한 대학, 전형과 관련된 신설/첨단학과만 표시합니다.</p>"
-        else:
-            html += "<p>추천한 대학, 전형과 관련된 신설/첨단학과만 표시합니다.</p>"
 
-        if i == 0:
-            html += "<br>"
+            if i == 0:
+                html += "<br>"
 
-    html += "</div>"
+        html += "</div>"
 
-    html += """
+        html += """
             </body>
             </html>
             """
 
-    html_filename = f"report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-    save_report_as_html(html, html_filename)
+    with progress.stage('업로드'):
+        html_filename = f"report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
+        save_report_as_html(html, html_filename)
 
-    file_id = upload_to_google_drive(html_filename)
+        file_id = upload_to_google_drive(html_filename)
 
-    os.remove(html_filename)
+        os.remove(html_filename)
 
     return html, tables, file_id
 
@@ -987,7 +1066,7 @@ def generate_detailed_tables(processed_data):
                     appropriate_df.assign(구분='적정')
                 ])
 
-                df = df.fillna('-')
+                df = df.astype(object).fillna('-')
                 df.columns = [column_mapping.get(col, col) for col in df.columns]
                 df = df[[col for col in columns_to_display if col in df.columns]]
                 tables.append({
@@ -1013,30 +1092,23 @@ def show_report_generation():
     # 보고서 작성 탭에서는 항상 기존 방식 사용
     st.session_state['report_data_source'] = "기존"
 
-    if 'final_selection' not in st.session_state:
+    if 'final_selection_ids' not in st.session_state:
         st.warning("최종 필터링을 먼저 완료해주세요.")
         return
 
-    final_selection = st.session_state['final_selection']
+    # 세션에 저장된 행 번호로 필요한 행만 꺼냄
+    final_selection = {key: take_rows(ids) for key, ids in st.session_state['final_selection_ids'].items()}
     student_info = st.session_state['student_info']
     new_advanced_data = {
-        '교과': st.session_state.get('subject_new_or_advanced_filtered', pd.DataFrame()),
-        '학종': st.session_state.get('comprehensive_new_or_advanced_filtered', pd.DataFrame())
+        '교과': take_rows(st.session_state.get('subject_new_or_advanced_filtered_ids', EMPTY_ROW_IDS)),
+        '학종': take_rows(st.session_state.get('comprehensive_new_or_advanced_filtered_ids', EMPTY_ROW_IDS))
     }
 
-    all_data = st.session_state.get('all_data', pd.DataFrame())
-
-    # 랭킹에 따라 데이터 재정렬
-    def sort_by_ranking(df):
-        if '대학명' in df.columns:
-            ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-            df['ranking'] = df['대학명'].map(ranking_dict).fillna(len(ranking))
-            return df.sort_values('ranking').drop('ranking', axis=1)
-        return df
+    all_data = get_dataset('main')
 
-    # 각 카테고리별로 데이터 정렬
+    # 각 카테고리별로 랭킹에 따라 데이터 정렬
     for key in final_selection.keys():
-        final_selection[key] = sort_by_ranking(final_selection[key])
+        final_selection[key] = sort_by_rank(final_selection[key])
 
     def preprocess_data(df):
         if df is None or df.empty:
@@ -1049,10 +1121,8 @@ def show_report_generation():
 
     if st.button("보고서 생성"):
         with st.spinner("보고서 작성 중입니다..."):
-            progress_bar = st.progress(0)
-            for i in range(100):
-                time.sleep(1)
-                progress_bar.progress(i + 1)
+            # 실제 생성 단계가 끝날 때마다 진행률과 남은 예상 시간을 갱신
+            progress_bar = st.progress(0, text="보고서 준비 중")
 
             processed_final_selection = {
                 '교과': preprocess_data(final_selection.get('교과', pd.DataFrame())),
@@ -1063,8 +1133,9 @@ def show_report_generation():
 
             all_data = preprocess_data(all_data)
 
-            additional_data = st.session_state['additional_data']
-            html, tables, file_id = generate_report(processed_final_selection, student_info, all_data, additional_data)
+            additional_data = get_dataset('additional')
+            html, tables, file_id = generate_report(processed_final_selection, student_info, all_data, additional_data,
+                                                    on_progress=progress_bar.progress)
 
         st.success("보고서 생성이 완료되었습니다!")
         st.components.v1.html(html, height=600, scrolling=True)
@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
-from data_loader import data, ranking, remove_duplicates
-from filters import filter_data, apply_filters
-from category_mapping import DETAIL_TO_MID_CATEGORY, MID_TO_MAIN_CATEGORY
+import numpy as np
+from data_loader import data, remove_duplicates, sort_by_rank, universities_by_rank, percentile_column_name, \
+    take_rows, row_ids, EMPTY_ROW_IDS
+from filters import filter_data, eligible_counter, option_predicates
+from ui_components import show_match_count, show_total_match_count, selection_grid, flash_success
+from result_cache import cached_by_key, row_ids_key, stage_cache
 
 def create_filter_box(title, content):
     st.markdown(f"""
@@ -34,33 +37,13 @@ def add_search_range_selector(prefix):
     )
     return search_range
 
-def filter_by_search_range(df, student_info, search_range):
-    if df.empty:
-        return df
-
-    if search_range == "대계열 검색":
-        return df[df['계열'].isin(student_info['field'])]
-    elif search_range == "중계열 검색":
-        mid_categories = list(set([DETAIL_TO_MID_CATEGORY.get(field, "") for field in student_info['detail_fields']]))
-        return df[df['계열구분'].isin(mid_categories)]
-    elif search_range == "소계열 검색":
-        return df[df['계열상세명'].apply(
-            lambda x: any(field.lower() in str(x).lower() for field in student_info['detail_fields']))]
-    return df
-
-def sort_by_ranking(df):
-    ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-    df['ranking'] = df['대학명'].map(ranking_dict)
-    df = df.sort_values('ranking')
-    df = df.drop('ranking', axis=1)
-    return df
-
-@st.cache_data
-def apply_second_filtering(df, selected_universities):
+@cached_by_key(stage_cache, lambda ids, selected_universities: (row_ids_key(ids), tuple(sorted(set(selected_universities)))))
+def apply_second_filtering(ids, selected_universities):
+    # 선택한 대학의 행 번호만 남기고 중복을 제거한 뒤 랭킹 순서로
+    df = take_rows(ids)
     filtered_df = df[df['대학명'].isin(selected_universities)]
     filtered_df = remove_duplicates(filtered_df)
-    filtered_df = sort_by_ranking(filtered_df)
-    return reorder_columns(filtered_df)
+    return row_ids(sort_by_rank(filtered_df))
 
 
 def display_ranked_university_checklist(df, title, prefix=""):
@@ -73,8 +56,7 @@ def display_ranked_university_checklist(df, title, prefix=""):
         st.error(f"{title}의 데이터에 '대학명' 열이 없습니다.")
         return []
 
-    ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-    sorted_universities = sorted(df['대학명'].unique(), key=lambda x: ranking_dict.get(x, len(ranking)))
+    sorted_universities = universities_by_rank(df)
 
     selected_universities = []
     cols = st.columns(3)
@@ -85,23 +67,14 @@ def display_ranked_university_checklist(df, title, prefix=""):
     return selected_universities
 
 
-def reorder_columns(df):
-    first_columns = ['선택', '대학명', '모집단위', '2024년_입결50%', '2024년_입결70%', '2024년_경쟁률', '전형명', '2025년_모집인원', '2024년_충원율(%)', '2025년_최저요약']
-    other_columns = [col for col in df.columns if col not in first_columns + ['No.', '계열상세']]
-
-    # '선택' 컬럼이 없는 경우 추가
-    if '선택' not in df.columns:
-        df['선택'] = True
-
-    return df[first_columns + other_columns]
-
-def create_advanced_filters(prefix):
+def create_advanced_filters(prefix, counter=None):
     filters = {}
 
     if st.checkbox("모집인원 필터 적용", key=f"{prefix}_recruitment_filter"):
         with st.expander("모집인원 필터 설정"):
             min_recruitment = st.number_input("최소 모집인원", min_value=1, value=5, step=1, key=f"{prefix}_min_recruitment")
             filters['2025년_모집인원'] = min_recruitment
+            show_match_count(counter, filters, '2025년_모집인원')
 
     if st.checkbox("경쟁률 필터 적용", key=f"{prefix}_competition_filter"):
         with st.expander("경쟁률 필터 설정"):
@@ -110,15 +83,19 @@ def create_advanced_filters(prefix):
                                               key=f"{prefix}_low_competition")
             if low_competition < 100:  # 100 이상의 값은 무시 (실질적으로 필터링하지 않음)
                 filters['2024년_경쟁률'] = low_competition
+                show_match_count(counter, filters, '2024년_경쟁률')
 
             col1, col2 = st.columns(2)
             with col1:
                 competition_percentile = st.slider("작년 경쟁률 백분위", 0, 100, (10, 70), 1, key=f"{prefix}_competition_percentile")
                 filters['2024년_경쟁률백분위'] = competition_percentile
+                show_match_count(counter, filters, '2024년_경쟁률백분위')
 
             with col2:
                 competition_avg_percentile = st.slider("3개년 평균 경쟁률 백분위", 0, 100, (0, 80), 1, key=f"{prefix}_competition_avg_percentile")
-                filters['3개년_경쟁률_평균'] = competition_avg_percentile
+                # 같은 전형구분/계열구분 안에서의 3개년 평균 경쟁률 백분위로 비교
+                filters[percentile_column_name('3개년_경쟁률_평균')] = competition_avg_percentile
+                show_match_count(counter, filters, percentile_column_name('3개년_경쟁률_평균'))
 
             st.write("\n")
             st.write("경쟁률 변동 정도 (%)")
@@ -128,13 +105,16 @@ def create_advanced_filters(prefix):
             with col4:
                 competition_change_max = st.number_input("최대(1000)", 1, 1000, 300, key=f"{prefix}_competition_change_max")
             filters['2024년_경쟁률변동(%)'] = (competition_change_min, competition_change_max)
+            show_match_count(counter, filters, '2024년_경쟁률변동(%)')
 
     if st.checkbox("입결 필터 적용", key=f"{prefix}_entry_score_filter"):
         with st.expander("입결 필터 설정"):
             col1, col2 = st.columns(2)
             with col1:
                 entry_score_percentile = st.slider("작년 입결 백분위", 0, 100, (30, 70), 1, key=f"{prefix}_entry_score_percentile")
-                filters['2024년_입결70%'] = entry_score_percentile
+                # 같은 전형구분/계열구분 안에서의 입결70% 백분위로 비교
+                filters[percentile_column_name('2024년_입결70%')] = entry_score_percentile
+                show_match_count(counter, filters, percentile_column_name('2024년_입결70%'))
 
             st.write("작년 입결70% 변동 정도 (%)")
             col3, col4 = st.columns(2)
@@ -143,6 +123,7 @@ def create_advanced_filters(prefix):
             with col4:
                 entry_score_change_max = st.number_input("최대(200)", 0, 200, 0, key=f"{prefix}_entry_score_change_max")
             filters['2024년_입결70%변동(%)'] = (entry_score_change_min, entry_score_change_max)
+            show_match_count(counter, filters, '2024년_입결70%변동(%)')
 
     if st.checkbox("충원율 필터 적용", key=f"{prefix}_fill_rate_filter"):
         with st.expander("충원율 필터 설정"):
@@ -150,25 +131,15 @@ def create_advanced_filters(prefix):
             with col1:
                 fill_rate = st.slider("작년 충원율", 0, 500, (100, 300), 1, key=f"{prefix}_fill_rate")
                 filters['2024년_충원율(%)'] = fill_rate
+                show_match_count(counter, filters, '2024년_충원율(%)')
 
             with col2:
                 fill_rate_avg = st.slider("3개년 충원율", 0, 500, (80, 300), 1, key=f"{prefix}_fill_rate_avg")
                 filters['3개년_충원율_평균'] = fill_rate_avg
+                show_match_count(counter, filters, '3개년_충원율_평균')
 
     return filters
 
-def apply_advanced_filters(df, filters):
-    for key, value in filters.items():
-        if key == '2024년_경쟁률':
-            df = df[df[key] <= value]
-        elif isinstance(value, tuple):  # 범위 필터
-            df = df[(df[key] >= value[0]) & (df[key] <= value[1])]
-        elif key in ['2024년_경쟁률백분위', '3개년_경쟁률_평균', '2024년_입결70%', '2024년_입결50%']:
-            df = df[(df[key] >= value[0]) & (df[key] <= value[1])]
-        else:  # 단일 값 필터
-            df = df[df[key] >= value]
-    return df
-
 def show_subject_filtering():
     if 'student_info' not in st.session_state:
         st.warning("정보입력 탭에서 먼저 정보를 입력하세요.")
@@ -181,160 +152,100 @@ def show_subject_filtering():
     create_filter_box("🔍 검색 범위", "")
     search_range = add_search_range_selector("subject")
 
+    # 옵션 필터별 충족 건수 미리보기 (검색 범위까지 적용한 행 기준)
+    counter = eligible_counter(student_info, data, '교과', search_range) if '교과' in student_info['admission_type'] else None
+
     create_filter_box("⚙️ 옵션 필터", "")
-    filters = create_advanced_filters(prefix="subject")
+    filters = create_advanced_filters(prefix="subject", counter=counter)
 
     create_filter_box("📊 수능최저역량", "")
     lowest_ability_filter = st.checkbox("수능최저역량 반영", key="subject_lowest_ability")
     st.session_state['student_info']['lowest_ability_filter'] = lowest_ability_filter
+    show_total_match_count(counter, option_predicates(student_info, filters, lowest_ability_filter))
 
     st.markdown("&nbsp;")
 
     col1, col2, col3 = st.columns(3)
     with col1:
         if st.button("1차 필터링", key="subject_first_filter_button"):
-            filtered_data = filter_data(student_info, data)
-
+            # 검색 범위, 옵션 필터, 수능최저 조건까지 한 번에 평가
+            # 조건별 마스크를 세션에 보관해 두고, 바뀐 조건만 다시 계산
+            if 'subject_predicate_masks' not in st.session_state:
+                st.session_state['subject_predicate_masks'] = {}
+            filtered_data = filter_data(student_info, data, search_range, filters, lowest_ability_filter,
+                                        mask_cache=st.session_state['subject_predicate_masks'])
+
+            # 세션에는 데이터프레임 대신 행 번호만 저장
             if isinstance(filtered_data, pd.DataFrame) and not filtered_data.empty:
-                filtered_data = filter_by_search_range(filtered_data, student_info, search_range)
-                filtered_data = apply_advanced_filters(filtered_data, filters)
-
-                if lowest_ability_filter:
-                    filtered_data = filtered_data[filtered_data['2025년_수능최저코드'] <= student_info['lowest_ability_code']]
-
                 # 데이터 분류
                 general_data = filtered_data[filtered_data['분류'] == '일반']
                 new_advanced_data = filtered_data[filtered_data['분류'].isin(['신설', '첨단'])]
 
-                general_data = sort_by_ranking(general_data)
-                new_advanced_data = sort_by_ranking(new_advanced_data)
-
-                st.session_state['subject_first_filter_results'] = general_data
-                st.session_state['subject_new_or_advanced'] = new_advanced_data
+                st.session_state['subject_first_filter_ids'] = row_ids(sort_by_rank(general_data))
+                st.session_state['subject_new_or_advanced_ids'] = row_ids(sort_by_rank(new_advanced_data))
                 st.success("1차 필터링이 완료되었습니다.")
             else:
                 st.warning("필터링 결과가 없습니다.")
-                st.session_state['subject_first_filter_results'] = pd.DataFrame()
-                st.session_state['subject_new_or_advanced'] = pd.DataFrame()
+                st.session_state['subject_first_filter_ids'] = EMPTY_ROW_IDS
+                st.session_state['subject_new_or_advanced_ids'] = EMPTY_ROW_IDS
 
 
-    if 'subject_first_filter_results' in st.session_state:
+    if 'subject_first_filter_ids' in st.session_state:
         st.markdown("---")
         st.markdown("&nbsp;")
         st.subheader("1️⃣ 1차 필터링 결과")
-        df = st.session_state['subject_first_filter_results']
-        if isinstance(df, pd.DataFrame):
-            if not df.empty and '대학명' in df.columns:
-                df = reorder_columns(df)  # 컬럼 재정렬
-                selected = display_ranked_university_checklist(df, "필터링된 대학 리스트", prefix="subject_")
-                st.session_state['subject_selected_universities'] = selected
-            else:
-                st.warning("필터링된 데이터가 없거나 '대학명' 열이 없습니다.")
+        df = take_rows(st.session_state['subject_first_filter_ids'])
+        if not df.empty:
+            selected = display_ranked_university_checklist(df, "필터링된 대학 리스트", prefix="subject_")
+            st.session_state['subject_selected_universities'] = selected
         else:
-            st.warning("필터링 결과가 DataFrame 형식이 아닙니다.")
+            st.warning("필터링된 데이터가 없습니다.")
 
     with col2:
         if st.button("2차 필터링", key="subject_second_filter_button"):
-            general_df = st.session_state.get('subject_first_filter_results', pd.DataFrame())
-            new_advanced_df = st.session_state.get('subject_new_or_advanced', pd.DataFrame())
-
-            if isinstance(general_df, pd.DataFrame) and isinstance(new_advanced_df, pd.DataFrame):
-                selected = st.session_state.get('subject_selected_universities', [])
-
-                if not general_df.empty and '대학명' in general_df.columns:
-                    filtered_general_df = apply_second_filtering(general_df, selected)
-                    st.session_state['subject_second_filter_results'] = filtered_general_df
+            selected = st.session_state.get('subject_selected_universities', [])
+            general_ids = st.session_state.get('subject_first_filter_ids', EMPTY_ROW_IDS)
+            new_advanced_ids = st.session_state.get('subject_new_or_advanced_ids', EMPTY_ROW_IDS)
 
-                if not new_advanced_df.empty and '대학명' in new_advanced_df.columns:
-                    filtered_new_advanced_df = apply_second_filtering(new_advanced_df, selected)
-                    st.session_state['subject_new_or_advanced_filtered'] = filtered_new_advanced_df
-
-                st.success("2차 필터링이 완료되었습니다.")
-            else:
-                st.warning("필터링 결과가 DataFrame 형식이 아닙니다.")
+            st.session_state['subject_second_filter_ids'] = apply_second_filtering(general_ids, selected)
+            st.session_state['subject_new_or_advanced_filtered_ids'] = apply_second_filtering(new_advanced_ids, selected)
+            flash_success("2차 필터링이 완료되었습니다.")
 
 
 
-    if 'subject_second_filter_results' in st.session_state:
+    if 'subject_second_filter_ids' in st.session_state:
         st.markdown("---")
         st.markdown("&nbsp;")
         st.subheader("2️⃣ 2차 필터링 결과")
-        df = st.session_state['subject_second_filter_results']
-        if isinstance(df, pd.DataFrame):
-            if not df.empty:
-                st.write("**필터링된 대학 리스트**")
-                if '대학명' in df.columns:
-                    for univ in df['대학명'].unique():
-                        st.write(f"**{univ}**")
-                        group = df[df['대학명'] == univ]
-
-                        group = reorder_columns(group)  # 컬럼 재정렬
-
-                        edited_df = st.data_editor(
-                            group,
-                            hide_index=True,
-                            column_config={
-                                "선택": st.column_config.CheckboxColumn(
-                                    "선택",
-                                    help="이 행을 선택하려면 체크하세요"
-                                )
-                            },
-                            disabled=group.columns.drop('선택'),
-                            key=f"editor_subject_{univ}"
-                        )
-                        st.session_state[f'subject_displayed_{univ}'] = edited_df
-                else:
-                    st.warning("필터링된 리스트에 '대학명' 열이 없습니다.")
-            else:
-                st.warning("필터링된 리스트에 데이터가 없습니다.")
+        df = take_rows(st.session_state['subject_second_filter_ids'])
+        if not df.empty:
+            st.write("**필터링된 대학 리스트**")
+            # 대학별로 묶은 한 개의 선택 그리드 (선택한 행의 행 번호만 보관)
+            st.session_state['subject_second_selected_ids'] = selection_grid(df, key='subject_second')
         else:
-            st.warning("필터링 결과가 DataFrame 형식이 아닙니다.")
+            st.session_state['subject_second_selected_ids'] = EMPTY_ROW_IDS
+            st.warning("필터링된 리스트에 데이터가 없습니다.")
 
 
         # 신설 및 첨단융합 학과 표시
         st.subheader("신설 또는 첨단융합 학과")
-        new_df = st.session_state.get('subject_new_or_advanced_filtered', pd.DataFrame())
+        new_df = take_rows(st.session_state.get('subject_new_or_advanced_filtered_ids', EMPTY_ROW_IDS))
         if not new_df.empty:
-            edited_new_df = st.data_editor(
-                new_df,
-                hide_index=True,
-                column_config={
-                    "선택": st.column_config.CheckboxColumn(
-                        "선택",
-                        help="이 행을 선택하려면 체크하세요"
-                    )
-                },
-                disabled=new_df.columns.drop('선택'),
-                key="editor_subject_new_or_advanced"
-            )
-            st.session_state['subject_new_or_advanced_edited'] = edited_new_df
+            st.session_state['subject_new_or_advanced_selected_ids'] = selection_grid(new_df, key='subject_new_or_advanced')
         else:
+            st.session_state['subject_new_or_advanced_selected_ids'] = EMPTY_ROW_IDS
             st.write("선택된 대학의 신설 또는 첨단융합 학과가 없습니다.")
 
 
 
     with col3:
         if st.button("결과 저장", key="save_subject_results_button"):
-            saved_results = pd.DataFrame()
-            df = st.session_state.get('subject_second_filter_results', pd.DataFrame())
-            new_df = st.session_state.get('subject_new_or_advanced_edited', pd.DataFrame())
-
-            if isinstance(df, pd.DataFrame):
-                if not df.empty and '대학명' in df.columns:
-                    for univ in df['대학명'].unique():
-                        if f'subject_displayed_{univ}' in st.session_state:
-                            univ_df = st.session_state[f'subject_displayed_{univ}']
-                            saved_results = pd.concat([saved_results, univ_df[univ_df['선택']]])
-
-            if isinstance(new_df, pd.DataFrame) and not new_df.empty:
-                saved_results = pd.concat([saved_results, new_df[new_df['선택']]])
-
-            saved_results = reorder_columns(saved_results)
-            saved_results = sort_by_ranking(saved_results)
-            st.session_state['saved_subject_results'] = saved_results
-            total_count = len(saved_results)
+            selected_ids = [st.session_state.get('subject_second_selected_ids', EMPTY_ROW_IDS),
+                            st.session_state.get('subject_new_or_advanced_selected_ids', EMPTY_ROW_IDS)]
+            saved_ids = row_ids(sort_by_rank(take_rows(np.concatenate(selected_ids))))
+            st.session_state['saved_subject_ids'] = saved_ids
+            total_count = len(saved_ids)
             st.success(f"결과가 저장되었습니다. 총 {total_count}개의 학과가 저장되었습니다.")
 
-
 if __name__ == "__main__":
     show_subject_filtering()
\ No newline at end of file
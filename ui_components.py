@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from data_loader import ranking
+import numpy as np
+from data_loader import universities_by_rank, row_ids, take_rows, view_schemas, EMPTY_ROW_IDS
+from filters import advanced_filter_predicates
 
 def create_option_filters(prefix=""):
     filters = {'상향': {}, '적정': {}, '하향': {}}
@@ -71,8 +73,7 @@ def display_university_checklist(df, title, prefix=""):
         st.error(f"{title}의 데이터에 '대학명' 열이 없습니다.")
         return []
 
-    ranking_dict = {univ: i for i, univ in enumerate(ranking)}
-    universities = sorted(df['대학명'].unique(), key=lambda x: ranking_dict.get(x, float('inf')))
+    universities = universities_by_rank(df)
     selected_universities = []
     cols = st.columns(3)
     for i, univ in enumerate(universities):
@@ -103,4 +104,141 @@ def display_university_data(df, title):
         disabled=df.columns.drop('선택'),
         key=f"editor_{title.replace(' ', '_')}"
     )
-    return edited_df[edited_df['선택']]
\ No newline at end of file
+    return edited_df[edited_df['선택']]
+
+def show_match_count(counter, filters, key):
+    # 옵션 필터 위젯 아래에 해당 조건만 적용했을 때의 모집단위/대학 수를 표시
+    if counter is None or key not in filters:
+        return
+    rows, universities = counter.count(advanced_filter_predicates({key: filters[key]})[0])
+    st.caption(f"조건 충족: {rows}개 모집단위 · {universities}개 대학 (검색 범위 내 {counter.total}개 중)")
+
+
+def show_total_match_count(counter, predicates):
+    # 현재 설정한 옵션 필터를 모두 적용했을 때의 모집단위/대학 수를 표시
+    if counter is None:
+        return
+    rows, universities = counter.count_all(predicates)
+    st.caption(f"현재 조건 전체 충족: {rows}개 모집단위 · {universities}개 대학")
+
+
+def project_view(df, view):
+    # view_schemas.json에 정의된 화면(view)의 컬럼만 남김
+    return df[[column for column in view_schemas[view] if column in df.columns]]
+
+
+def show_row_detail(row_ids_on_page, labels, key):
+    """
+    행을 하나 고르면 그 행의 상세 컬럼(view_schemas의 detail)만 공유 데이터셋에서 꺼내 보여줍니다.
+    """
+    options = [None] + row_ids_on_page.tolist()
+    label_by_id = dict(zip(row_ids_on_page.tolist(), labels))
+    row_id = st.selectbox("상세 정보 보기", options, format_func=lambda i: "선택 안 함" if i is None else label_by_id[i],
+                          key=f'{key}_detail')
+    if row_id is not None:
+        detail = project_view(take_rows([row_id]), 'detail')
+        st.dataframe(detail.T.rename(columns=lambda _: '값').astype(str), use_container_width=True)
+
+
+# 선택 그리드 한 페이지에 표시할 대학 수
+GRID_UNIVERSITIES_PER_PAGE = 10
+
+
+def selection_grid(df, key, view='filter_grid', default_selected=True, universities_per_page=GRID_UNIVERSITIES_PER_PAGE):
+    """
+    대학별로 묶인 결과를 페이지 단위의 data_editor 하나로 보여주고, 선택한 행의 행 번호 배열(df 순서)을 반환합니다.
+    현재 페이지의 행과 view 화면의 컬럼만 브라우저로 보내며, 선택 상태는 행 번호 집합으로 세션에 보관합니다.
+    """
+    ids = row_ids(df)
+    ids_key = f'{key}_grid_ids'
+    selection_key = f'{key}_grid_selection'
+    base_key = f'{key}_grid_base'
+    # 표시할 행이 바뀌면 선택 상태를 기본값으로 초기화
+    if ids_key not in st.session_state or not np.array_equal(st.session_state[ids_key], ids):
+        st.session_state[ids_key] = ids
+        st.session_state[selection_key] = set(ids.tolist()) if default_selected else set()
+        st.session_state.pop(base_key, None)
+    selection = st.session_state[selection_key]
+    if df.empty:
+        return EMPTY_ROW_IDS
+
+    codes, universities = pd.factorize(df['대학명'].astype(object))
+    page_count = -(-len(universities) // universities_per_page)
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"페이지 (전체 {page_count}쪽, {len(universities)}개 대학)", min_value=1,
+                               max_value=page_count, value=1, step=1, key=f'{key}_grid_page')
+
+    # 현재 페이지에 속한 대학의 행만 대학별로 모아서 표시
+    first_code = (page - 1) * universities_per_page
+    positions = np.flatnonzero((codes >= first_code) & (codes < first_code + universities_per_page))
+    positions = positions[np.argsort(codes[positions], kind='stable')]
+    page_ids = ids[positions]
+
+    # data_editor는 data 내용이 바뀌면 위젯이 새로 만들어져 편집 상태가 초기화되므로,
+    # 페이지에 들어올 때의 선택 상태를 기준으로 고정해 두고 편집 내용(edited_rows)만 그 위에 적용
+    widget_key = f'{key}_grid_page_{page}'
+    if widget_key not in st.session_state or st.session_state.get(base_key, (None,))[0] != page:
+        st.session_state[base_key] = (page, np.isin(page_ids, list(selection)))
+    base_selected = st.session_state[base_key][1]
+
+    page_df = project_view(df.iloc[positions], view)
+    columns = list(page_df.columns)
+    page_df.insert(0, '선택', base_selected)
+    st.data_editor(
+        page_df,
+        hide_index=True,
+        column_config={
+            "선택": st.column_config.CheckboxColumn(
+                "선택",
+                help="이 행을 선택하려면 체크하세요"
+            )
+        },
+        disabled=columns,
+        key=widget_key
+    )
+
+    page_selected = base_selected.copy()
+    for position, changes in st.session_state[widget_key].get('edited_rows', {}).items():
+        if '선택' in changes:
+            page_selected[int(position)] = bool(changes['선택'])
+    selection.difference_update(page_ids.tolist())
+    selection.update(page_ids[page_selected].tolist())
+
+    # 상세 컬럼은 행을 골랐을 때만 가져옴
+    labels = (page_df['대학명'].astype(str) + ' ' + page_df['모집단위'].astype(str) + ' (' +
+              page_df['전형명'].astype(str) + ')').tolist()
+    show_row_detail(page_ids, labels, key)
+    return ids[np.isin(ids, list(selection))]
+
+
+def flash_success(message):
+    """
+    완료 메시지를 표시합니다. 이 실행 직후 앱 전체가 다시 실행되면 같은 탭 위쪽에 한 번 더 표시합니다.
+    """
+    st.success(message)
+    flash_messages = st.session_state.setdefault('flash_messages', {})
+    flash_messages.setdefault(st.session_state.get('current_tab'), []).append(message)
+
+
+def run_tab_fragment(name, render, watched_keys):
+    """
+    탭 하나를 fragment로 실행합니다. 탭 안의 위젯을 조작하면 그 탭만 다시 실행됩니다.
+    fragment 실행 중 다른 탭이 의존하는 세션 키(watched_keys)가 바뀌면 앱 전체를 한 번 다시 실행해 그 탭들을 갱신합니다.
+    """
+    @st.fragment
+    def tab():
+        st.session_state['current_tab'] = name
+        flash_messages = st.session_state.setdefault('flash_messages', {})
+        for message in flash_messages.pop(name, []):
+            st.success(message)
+
+        before = {key: id(st.session_state.get(key)) for key in watched_keys}
+        render()
+        changed = [key for key in watched_keys if id(st.session_state.get(key)) != before[key]]
+        if changed:
+            st.rerun()
+        flash_messages.pop(name, None)
+
+    tab()
+